@@ -1,35 +1,46 @@
-import os,re,sys
-from dataclasses import dataclass
-from logics.openai_logic import openai_logic
-from logics.mathpix_logic import mathpix_logic
-import pymupdf as fitz 
+from utils.job_spec import JobSpec
 
 # --- Main pipeline ---
 def run(
-    payload: dict()
+    spec: JobSpec,
+    events = None
 ):
-    globals().update(payload)
+    # Everything comes from the spec, so concurrent jobs share no state.
+    # Backends are imported on first use, so only the selected engine's SDK loads
     try:
-        match engine_choice:
+        match spec.engine_choice:
             case "OpenAI (cloud)":
+                from logics.openai_logic import openai_logic
                 openai_logic(
-                    pdf_path=pdf_path,
-                    pages_arg=pages_arg,
-                    out_dir=out_dir,
-                    language_selected=language_selected,
-                    user_prompt=user_prompt, 
-                    api_key=api_key,
-                    model=model,
-                    title=title,
-                    content_page=content_page,
+                    pdf_path=spec.pdf_path,
+                    pages_arg=spec.pages_arg,
+                    out_dir=spec.out_dir,
+                    language_selected=spec.language_selected,
+                    user_prompt=spec.user_prompt,
+                    api_key=spec.api_key,
+                    model=spec.model,
+                    title=spec.title,
+                    content_page=spec.content_page,
+                    max_workers=spec.max_workers,
+                    adaptive_encoding=spec.adaptive_encoding,
+                    text_layer=spec.text_layer,
+                    batch_size=spec.batch_size,
+                    base_url=spec.base_url,
+                    stream=spec.stream,
+                    dedup_pages=spec.dedup_pages,
+                    collapse_builds=spec.collapse_builds,
+                    events=events,
                 )
             case "Mathpix (cloud)":
+                from logics.mathpix_logic import mathpix_logic
                 mathpix_logic(
-                    pdf_path=pdf_path,
-                    out_dir=out_dir,
-                    app_key=api_key,
-                    pages_arg=pages_arg,
-                    app_id=app_id,
+                    pdf_path=spec.pdf_path,
+                    out_dir=spec.out_dir,
+                    app_key=spec.api_key,
+                    pages_arg=spec.pages_arg,
+                    app_id=spec.app_id,
+                    base_url=spec.base_url,
+                    chunk_size=spec.chunk_size,
                 )
                 
             case "Custom":
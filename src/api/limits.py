@@ -0,0 +1,24 @@
+import threading
+from contextlib import contextmanager
+from constants.constants import MAX_REQUESTS_IN_FLIGHT
+
+_request_slots = None
+
+def limit_requests(max_in_flight: int):
+    # Caps API requests (model and Mathpix) across every document and client of the process; 0 lifts the cap
+    global _request_slots
+    _request_slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+limit_requests(MAX_REQUESTS_IN_FLIGHT)
+
+@contextmanager
+def request_slot():
+    # Held for one HTTP request, including reading its (streamed) body
+    slots = _request_slots
+    if slots:
+        slots.acquire()
+    try:
+        yield
+    finally:
+        if slots:
+            slots.release()
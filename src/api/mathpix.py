@@ -1,60 +1,150 @@
-import json,requests,subprocess
-
-def mathpix(pdf_path:str,app_id:str,app_key:str) -> requests.Response:
-    options = {
-        "conversion_formats": {"docx": True, "tex.zip": True},
-        "math_inline_delimiters": ["$", "$"],
-        "rm_spaces": True
-    }
-    return requests.post("https://api.mathpix.com/v3/pdf",
-        headers={
-            "app_id": app_id, 
-            "app_key": app_key, 
-        },
-        data={
-            "options_json": json.dumps(options)
-        },
-        files={
-            "file": open(pdf_path,"rb")
+import os,json,asyncio,threading,requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from constants.constants import MATHPIX_BASE_URL,MATHPIX_POLL_MIN_SECONDS,MATHPIX_POLL_MAX_SECONDS,MATHPIX_POLL_FACTOR
+from utils.misc import printf
+from utils.office_pool import get_pool
+from api.limits import request_slot
+
+# Artifacts requested from Mathpix and the file each one is saved as
+ARTIFACTS = {"docx": "master.docx", "tex.zip": "master.tex.zip"}
+
+class MathpixClient:
+    """
+    Thin synchronous Mathpix v3 client on a pooled requests.Session. Every
+    call makes exactly one HTTP request, holding one of the process-wide
+    request slots, and parses the body once.
+    """
+    def __init__(self, app_id:str, app_key:str, base_url:str = MATHPIX_BASE_URL):
+        self.base_url = (base_url or MATHPIX_BASE_URL).rstrip("/")
+        self.session = requests.Session()
+        self.session.headers.update({"app_id": app_id, "app_key": app_key})
+        # urllib3 retries connection failures for every method, but read errors
+        # and error statuses only for idempotent ones (not POST). An upload is
+        # therefore only retried when it never reached Mathpix; retrying it
+        # after the server accepted it would start a second, billed job
+        retry = Retry(total=3, connect=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def submit(self, pdf_path:str) -> str:
+        options = {
+            "conversion_formats": {fmt: True for fmt in ARTIFACTS},
+            "math_inline_delimiters": ["$", "$"],
+            "rm_spaces": True
         }
-    )
-
-def mathpix_writeback(pdf_id:str, app_id:str,app_key:str,out_dir:str): 
-    headers = {
-        "app_id": app_id,
-        "app_key": app_key 
-    }
-    # get docx response
-    url = "https://api.mathpix.com/v3/pdf/" + pdf_id + ".docx"
-    response = requests.get(url, headers=headers)
-    master_docx = out_dir + "/master.docx"
-    master_pdf = out_dir + "/master.pdf"
-    master_latex_zip = out_dir + "/master.tex.zip"
-    with open(master_docx, "wb") as f:
-        f.write(response.content)
-    # get LaTeX zip file
-    url = "https://api.mathpix.com/v3/pdf/" + pdf_id + ".tex"
-    response = requests.get(url, headers=headers)
-    with open(master_latex_zip, "wb") as f:
-        f.write(response.content)
-    subprocess.run(["libreoffice", "--headless", "--convert-to", "pdf", master_docx, "--outdir", out_dir])
-
-def mathpix_isprocessing(pdf_id:str,app_id:str,app_key:str) -> bool:
-    headers = {
-        "app_id": app_id,
-        "app_key": app_key 
-    }
-    url = "https://api.mathpix.com/v3/pdf/" + pdf_id
-    r = requests.get(url, headers=headers)
-    if (r.json()["status"]!="completed"):
-        return True 
-    url = "https://api.mathpix.com/v3/converter/" + pdf_id
-    r = requests.get(url,headers=headers)
-    if (r.json()["status"]!="completed" 
-            or r.json()["conversion_status"]["docx"]["status"]=="processing" 
-            or r.json()["conversion_status"]["tex.zip"]["status"]=="processing"):
-        return True 
-    return False 
+        with open(pdf_path, "rb") as f, request_slot():
+            r = self.session.post(self.base_url + "/pdf", data={"options_json": json.dumps(options)}, files={"file": f})
+        r.raise_for_status()
+        body = r.json()
+        if "pdf_id" not in body:
+            raise Exception(f"Mathpix upload failed: {body}")
+        return body["pdf_id"]
+
+    def status(self, pdf_id:str) -> dict:
+        with request_slot():
+            r = self.session.get(self.base_url + "/pdf/" + pdf_id)
+        r.raise_for_status()
+        return r.json()
+
+    def conversion_status(self, pdf_id:str) -> dict:
+        with request_slot():
+            r = self.session.get(self.base_url + "/converter/" + pdf_id)
+        r.raise_for_status()
+        return r.json()
+
+    def download(self, pdf_id:str, fmt:str, dest:str):
+        # Streamed to disk so large artifacts are never held in memory, and
+        # swapped in whole so hard links of a published job keep the old file
+        tmp = dest + ".tmp"
+        with request_slot(), self.session.get(self.base_url + "/pdf/" + pdf_id + "." + fmt.replace(".zip", ""), stream=True) as r:
+            r.raise_for_status()
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+        os.replace(tmp, dest)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(app_id:str, app_key:str, base_url:str = MATHPIX_BASE_URL) -> MathpixClient:
+    key = (base_url or MATHPIX_BASE_URL, app_id, app_key)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = MathpixClient(app_id, app_key, base_url)
+        return _clients[key]
+
+def convert_docx_to_pdf(docx_path:str, out_dir:str):
+    get_pool().convert(docx_path, out_dir)
+
+async def poll_artifacts(client:MathpixClient, pdf_id:str, ready:dict):
+    """
+    Poll until every artifact in ready ({format: asyncio.Event}) can be
+    downloaded, setting each event as soon as its format is done. The delay
+    grows while nothing changes and drops back when progress is reported.
+    """
+    delay = MATHPIX_POLL_MIN_SECONDS
+    pdf_done = False
+    last_progress = None
+    while True:
+        if not pdf_done:
+            status = await asyncio.to_thread(client.status, pdf_id)
+            if status.get("status") == "error":
+                raise Exception(f"Mathpix processing failed: {status}")
+            pdf_done = status.get("status") == "completed"
+            progress = status.get("percent_done")
+        if pdf_done:
+            conversion = await asyncio.to_thread(client.conversion_status, pdf_id)
+            formats = conversion.get("conversion_status", {})
+            for fmt, event in ready.items():
+                state = formats.get(fmt, {}).get("status")
+                if state == "error":
+                    raise Exception(f"Mathpix {fmt} conversion failed: {formats[fmt]}")
+                if state == "completed":
+                    event.set()
+            progress = sum(event.is_set() for event in ready.values())
+            if all(event.is_set() for event in ready.values()):
+                return
+        if progress != last_progress:
+            last_progress = progress
+            delay = MATHPIX_POLL_MIN_SECONDS
+        await asyncio.sleep(delay)
+        delay = min(MATHPIX_POLL_MAX_SECONDS, delay * MATHPIX_POLL_FACTOR)
+
+async def mathpix_convert(client:MathpixClient, pdf_path:str, out_dir:str, converter=None) -> str:
+    """
+    Upload one PDF and fetch its artifacts into out_dir. Each artifact is
+    downloaded as soon as it is ready and the docx to pdf conversion starts
+    while the tex.zip download is still running. Returns the Mathpix pdf_id.
+    """
+    converter = converter or convert_docx_to_pdf
+    pdf_id = await asyncio.to_thread(client.submit, pdf_path)
+    printf(f"Mathpix pdf_id: {pdf_id}")
+    ready = {fmt: asyncio.Event() for fmt in ARTIFACTS}
 
+    async def fetch(fmt:str):
+        await ready[fmt].wait()
+        dest = out_dir + "/" + ARTIFACTS[fmt]
+        await asyncio.to_thread(client.download, pdf_id, fmt, dest)
+        if fmt == "docx":
+            await asyncio.to_thread(converter, dest, out_dir)
 
+    # A failure anywhere cancels the poller and the other downloads
+    try:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(poll_artifacts(client, pdf_id, ready))
+            for fmt in ARTIFACTS:
+                group.create_task(fetch(fmt))
+    except ExceptionGroup as e:
+        raise e.exceptions[0]
+    return pdf_id
 
+async def mathpix_convert_many(client:MathpixClient, jobs:list, max_concurrent:int) -> list:
+    # jobs: [(pdf_path, out_dir)], converted at most max_concurrent at a time
+    semaphore = asyncio.Semaphore(max_concurrent)
+    async def run(pdf_path:str, out_dir:str):
+        async with semaphore:
+            return await mathpix_convert(client, pdf_path, out_dir)
+    return await asyncio.gather(*(run(pdf_path, out_dir) for pdf_path, out_dir in jobs))
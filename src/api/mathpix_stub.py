@@ -0,0 +1,127 @@
+"""
+Local stand-in for the Mathpix v3 PDF API, for tests and benchmarks.
+
+    python src/api/mathpix_stub.py --port 8090 --processing 2
+
+then use http://127.0.0.1:8090/v3 as the Mathpix base URL. Uploads
+"finish" after --processing seconds (the docx a little before tex.zip) and
+the artifacts are small but valid files.
+"""
+import io,json,time,uuid,random,zipfile,argparse,threading
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+
+def make_tex_zip(pdf_id:str) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr(f"{pdf_id}/{pdf_id}.tex", "\\documentclass{article}\n\\begin{document}\nStub page.\n\\end{document}\n")
+    return buf.getvalue()
+
+DOCX_PARTS = {
+    "[Content_Types].xml":
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>',
+    "_rels/.rels":
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="word/document.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>',
+    "word/document.xml":
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        '<w:body><w:p><w:r><w:t>Stub page {pdf_id}.</w:t></w:r></w:p></w:body></w:document>',
+}
+
+def make_docx(pdf_id:str) -> bytes:
+    # The smallest package Word and LibreOffice open: content types, the package relationship and one paragraph
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, xml in DOCX_PARTS.items():
+            z.writestr(name, xml.replace("{pdf_id}", pdf_id))
+    return buf.getvalue()
+
+class MathpixStub:
+    def __init__(self, processing:float = 1.0, latency:float = 0.0, error_rate:float = 0.0):
+        self.processing = processing
+        self.latency = latency
+        self.error_rate = error_rate
+        self.uploads = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def state(self, pdf_id:str) -> dict:
+        elapsed = time.monotonic() - self.uploads[pdf_id]
+        done = lambda share: "completed" if elapsed >= self.processing * share else "processing"
+        return {"pdf": done(0.6), "docx": done(0.8), "tex.zip": done(1.0),
+                "percent_done": min(100, int(100 * elapsed / (self.processing * 0.6 or 1)))}
+
+    def handler(stub):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, code:int, body, content_type:str = "application/json"):
+                data = json.dumps(body).encode() if content_type == "application/json" else body
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def begin(self) -> bool:
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+                if random.random() < stub.error_rate:
+                    self.reply(503, {"error": "stub failure"})
+                    return False
+                return True
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.begin():
+                    return
+                pdf_id = uuid.uuid4().hex[:16]
+                stub.uploads[pdf_id] = time.monotonic()
+                self.reply(200, {"pdf_id": pdf_id})
+
+            def do_GET(self):
+                if not self.begin():
+                    return
+                parts = self.path.rstrip("/").split("/")
+                name = parts[-1]
+                pdf_id = name.split(".")[0]
+                if pdf_id not in stub.uploads:
+                    return self.reply(404, {"error": "unknown pdf_id"})
+                state = stub.state(pdf_id)
+                if parts[-2] == "converter":
+                    return self.reply(200, {"status": state["pdf"], "conversion_status": {
+                        "docx": {"status": state["docx"]}, "tex.zip": {"status": state["tex.zip"]}}})
+                if name.endswith(".docx"):
+                    return self.reply(200, make_docx(pdf_id), "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+                if name.endswith(".tex"):
+                    return self.reply(200, make_tex_zip(pdf_id), "application/zip")
+                self.reply(200, {"status": state["pdf"], "percent_done": state["percent_done"]})
+        return Handler
+
+    def serve(self, host:str = "127.0.0.1", port:int = 0) -> ThreadingHTTPServer:
+        # Runs in a daemon thread; the bound port is server.server_address[1]
+        server = ThreadingHTTPServer((host, port), self.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Mathpix v3 stand-in")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--processing", type=float, default=1.0, help="seconds until an upload is done")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+    server = MathpixStub(args.processing, args.latency, args.error_rate).serve(port=args.port)
+    print(f"Mathpix stub on http://127.0.0.1:{server.server_address[1]}/v3")
+    threading.Event().wait()
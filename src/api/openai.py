@@ -1,13 +1,253 @@
-from openai import OpenAI
-from typing import List
-def openai_api(api_key:str, model: str, system_msg:str, page:List[dict]):
-    client = OpenAI(api_key=api_key)
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user","content": page},
-        ],
-    )
-    return completion.choices[0].message.content
+import re,time,httpx,random,hashlib,threading
+from collections import deque,OrderedDict
+from openai import OpenAI, APIConnectionError, APIStatusError
+from typing import Callable, List, Optional
+from constants.constants import MAX_RETRIES,BACKOFF_BASE_SECONDS,BACKOFF_MAX_SECONDS,CLIENT_MAX_CACHED,CLIENT_IDLE_SECONDS
+from utils.misc import printf
+from api.limits import request_slot
 
+RETRY_STATUS = (408, 409, 429)
+
+class BadOutputError(Exception):
+    """Raised when a streamed completion is abandoned because its output is unusable."""
+
+def parse_reset(value: str) -> float:
+    # Rate-limit reset headers look like "1s", "6m0s", "120ms" or "0.5"
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(n) * units[u] for n, u in re.findall(r"([\d.]+)(ms|h|m|s)", value))
+
+class TokenBucket:
+    """
+    Client-side request throttle. Capacity and refill rate are learned from
+    the x-ratelimit-* response headers; until the first response arrives the
+    bucket does not throttle. A 429 or an exhausted budget blocks it until the
+    reset time the server gave.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.capacity = None
+        self.rate = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    self._cond.wait(self.blocked_until - now)
+                elif self.rate is None:
+                    return
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    self._cond.wait((1 - self.tokens) / self.rate)
+
+    def update(self, headers, used_tokens: int = 0):
+        limit = headers.get("x-ratelimit-limit-requests")
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            if limit and remaining:
+                # OpenAI request limits are per minute
+                first = self.rate is None
+                self.capacity = float(limit)
+                self.rate = float(limit) / 60.0
+                self.tokens = float(remaining) if first else min(self.tokens, float(remaining))
+                if float(remaining) <= 0:
+                    self.blocked_until = max(self.blocked_until, now + parse_reset(headers.get("x-ratelimit-reset-requests")))
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens and float(remaining_tokens) < used_tokens:
+                # The next request of this size would not fit in the token budget
+                self.blocked_until = max(self.blocked_until, now + parse_reset(headers.get("x-ratelimit-reset-tokens")))
+            self._cond.notify_all()
+
+    def block(self, seconds: float):
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+class ClientMetrics:
+    # Request counts and latencies of one job
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=1000)
+
+    def record(self, latency: float = None, retried: bool = False, failed: bool = False):
+        with self._lock:
+            if latency is not None:
+                self.requests += 1
+                self.latencies.append(latency)
+            self.retries += retried
+            self.failures += failed
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "latency_avg": sum(latencies) / len(latencies) if latencies else None,
+                "latency_p50": pick(0.5),
+                "latency_p95": pick(0.95),
+            }
+
+class PooledClient:
+    def __init__(self, base_url: str, api_key: str):
+        # Retries are handled here so they can follow the rate-limit headers
+        self.client = OpenAI(api_key=api_key, base_url=base_url or None, max_retries=0)
+        self.bucket = TokenBucket()
+        self.last_used = time.monotonic()
+        # Cleared when the endpoint rejects stream_options (not every OpenAI-compatible server knows it)
+        self.stream_usage = True
+
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+def get_client(base_url: str, api_key: str) -> PooledClient:
+    """
+    One client (connection pool and rate-limit state) per endpoint and key,
+    shared by all threads and jobs. Clients idle for CLIENT_IDLE_SECONDS, and
+    the least recently used beyond CLIENT_MAX_CACHED, are dropped so keys of
+    finished jobs are not kept; requests still running on one finish on it.
+    """
+    key = (base_url or "", hashlib.sha256(api_key.encode()).hexdigest())
+    now = time.monotonic()
+    with _clients_lock:
+        pooled = _clients.pop(key, None) or PooledClient(base_url, api_key)
+        pooled.last_used = now
+        _clients[key] = pooled
+        while len(_clients) > CLIENT_MAX_CACHED or now - next(iter(_clients.values())).last_used > CLIENT_IDLE_SECONDS:
+            _clients.popitem(last=False)
+        return pooled
+
+def retry_delay(attempt: int, headers=None) -> float:
+    if headers is not None:
+        retry_after = headers.get("retry-after-ms")
+        if retry_after:
+            return float(retry_after) / 1000.0
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    # Exponential backoff with jitter so parallel pages do not retry in lockstep
+    return random.uniform(0.5, 1.0) * min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+
+def record_usage(usage: Optional[dict], reported):
+    # cached_tokens: prompt tokens the provider served from its prompt prefix cache
+    if usage is not None and reported is not None:
+        details = getattr(reported, "prompt_tokens_details", None)
+        usage.update(prompt_tokens=reported.prompt_tokens, completion_tokens=reported.completion_tokens,
+                     cached_tokens=getattr(details, "cached_tokens", None) or 0)
+
+def stream_content(raw, on_delta: Callable[[str], Optional[str]], usage: dict = None) -> str:
+    # Accumulate the streamed deltas; on_delta sees each new delta and may
+    # return a reason to abandon the completion early
+    parts = []
+    stream = raw.parse()
+    try:
+        for chunk in stream:
+            # The usage arrives in a last chunk without choices
+            record_usage(usage, getattr(chunk, "usage", None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            reason = on_delta(delta)
+            if reason:
+                raise BadOutputError(reason)
+    except httpx.TransportError as e:
+        # The connection broke mid-stream; retried like one that failed to open
+        raise APIConnectionError(message=f"Stream interrupted: {e}", request=raw.http_request) from e
+    finally:
+        stream.close()
+    return "".join(parts)
+
+def openai_api(api_key:str, model: str, system_msg:str, page:List[dict], base_url:str = None, on_delta: Callable[[str], Optional[str]] = None, usage: dict = None, metrics: ClientMetrics = None,
+               on_reset: Callable[[], None] = None):
+    # usage, if given, receives the token counts of the successful attempt;
+    # metrics, if given, the latency, retries and failure of the request;
+    # on_reset, if given, is called before the request is sent again, so
+    # whatever on_delta saw of the failed attempt can be dropped
+    pooled = get_client(base_url, api_key)
+    metrics = metrics or ClientMetrics()
+    include_usage = on_delta is not None and pooled.stream_usage
+    attempt = 0
+    while True:
+        pooled.bucket.acquire()
+        with request_slot():
+            start = time.monotonic()
+            delay = None
+            try:
+                raw = pooled.client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_msg},
+                        {"role": "user","content": page},
+                    ],
+                    **({"stream": True} if on_delta is not None else {}),
+                    **({"stream_options": {"include_usage": True}} if include_usage else {}),
+                )
+                if on_delta is not None:
+                    content = stream_content(raw, on_delta, usage)
+                    if pooled.stream_usage and not include_usage:
+                        printf(f"{base_url} does not accept stream_options, streaming without token usage")
+                        pooled.stream_usage = False
+                    metrics.record(latency=time.monotonic() - start)
+                    pooled.bucket.update(raw.headers)
+                    return content
+            except (APIConnectionError, APIStatusError) as e:
+                status = getattr(e, "status_code", None)
+                if status == 400 and include_usage:
+                    # Try once more without stream_options, not counted as an
+                    # attempt; only a success there shows it was the cause
+                    include_usage = False
+                    if on_reset:
+                        on_reset()
+                    continue
+                retryable = status is None or status in RETRY_STATUS or status >= 500
+                if not retryable or attempt == MAX_RETRIES:
+                    metrics.record(failed=True)
+                    raise
+                headers = e.response.headers if status is not None else None
+                delay = retry_delay(attempt, headers)
+                if status == 429:
+                    pooled.bucket.block(delay)
+                metrics.record(retried=True)
+                if on_reset:
+                    on_reset()
+                if usage is not None:
+                    usage["retries"] = usage.get("retries", 0) + 1
+        if delay is not None:
+            # Back off without holding a request slot
+            time.sleep(delay)
+            attempt += 1
+            continue
+        completion = raw.parse()
+        metrics.record(latency=time.monotonic() - start)
+        record_usage(usage, completion.usage)
+        pooled.bucket.update(raw.headers, completion.usage.total_tokens if completion.usage else 0)
+        return completion.choices[0].message.content
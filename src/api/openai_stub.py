@@ -0,0 +1,165 @@
+"""
+Local stand-in for the OpenAI chat completions API, for tests and benchmarks.
+
+    python src/api/openai_stub.py --port 8091 --latency 1.5 --jitter 0.5
+
+then use http://127.0.0.1:8091/v1 as the base URL with any model and key.
+Every request answers after --latency (plus up to --jitter) seconds with a
+short LaTeX page per requested page, streamed or not, and reports token usage
+(including prompt tokens a prefix cache would have served) and rate-limit
+headers like the real API.
+"""
+import re,json,time,uuid,random,hashlib,argparse,threading
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+
+# Token counts: 4 bytes of text per token, a flat count per image.
+# Prompt caching as the real API does it: prefixes of at least 1024 tokens,
+# matched in blocks of 128 tokens
+BYTES_PER_TOKEN = 4
+IMAGE_TOKENS = 765
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CACHE_MAX_PREFIXES = 100000
+
+PAGE_BODY = "\\section*{{Stub page {pno}}}\nThe quick brown fox jumps over the lazy dog, $e^{{i\\pi}} + 1 = 0$.\n"
+
+def request_pages(messages: list) -> list:
+    # Batched requests name their pages in "--- PAGE n ---" headers, each
+    # at the start of a message part
+    text = "\n".join(part.get("text", "") for m in messages if isinstance(m["content"], list) for part in m["content"])
+    return [int(n) for n in re.findall(r"^--- PAGE (\d+) ---", text, flags=re.M)]
+
+def prompt_stream(messages: list) -> bytes:
+    # The prompt as the model sees it, one image standing for IMAGE_TOKENS tokens
+    out = []
+    for m in messages:
+        parts = m["content"] if isinstance(m["content"], list) else [{"type": "text", "text": m["content"]}]
+        out.append(m["role"].encode() + b"\n")
+        for part in parts:
+            if part["type"] == "text":
+                out.append(part["text"].encode())
+            else:
+                digest = hashlib.sha1(part["image_url"]["url"].encode()).digest()
+                out.append((digest * (IMAGE_TOKENS * BYTES_PER_TOKEN // len(digest) + 1))[:IMAGE_TOKENS * BYTES_PER_TOKEN])
+    return b"".join(out)
+
+def make_reply(messages: list) -> str:
+    pages = request_pages(messages)
+    if not pages:
+        return PAGE_BODY.format(pno=1)
+    return "".join(f"%%% BEGIN PAGE {pno} %%%\n{PAGE_BODY.format(pno=pno)}%%% END PAGE {pno} %%%\n" for pno in pages)
+
+class OpenAIStub:
+    def __init__(self, latency:float = 1.0, jitter:float = 0.0, error_rate:float = 0.0, chunk_chars:int = 16, rpm:int = 10000):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_chars = chunk_chars
+        self.rpm = rpm
+        self.requests = 0
+        self.prompt_bytes = 0
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, data: bytes) -> int:
+        # Length of the longest block-aligned prefix of this prompt sent before
+        block = CACHE_BLOCK_TOKENS * BYTES_PER_TOKEN
+        h = hashlib.sha1(data[:CACHE_MIN_TOKENS * BYTES_PER_TOKEN - block])
+        prefixes = []
+        for end in range(CACHE_MIN_TOKENS * BYTES_PER_TOKEN, len(data) + 1, block):
+            h.update(data[end - block:end])
+            prefixes.append((end, h.copy().digest()))
+        hit = 0
+        with self._lock:
+            for end, digest in prefixes:
+                if digest not in self._prefixes:
+                    break
+                hit = end
+            if len(self._prefixes) > CACHE_MAX_PREFIXES:
+                self._prefixes.clear()
+            self._prefixes.update(digest for _, digest in prefixes)
+        return hit // BYTES_PER_TOKEN
+
+    def handler(stub):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def headers_out(self, code:int, content_type:str, length:int = None):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("x-ratelimit-limit-requests", str(stub.rpm))
+                self.send_header("x-ratelimit-remaining-requests", str(stub.rpm - 1))
+                self.send_header("x-ratelimit-reset-requests", "60s")
+                if length is None:
+                    self.send_header("Transfer-Encoding", "chunked")
+                else:
+                    self.send_header("Content-Length", str(length))
+                self.end_headers()
+
+            def reply(self, code:int, body:dict, extra:dict = ()):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in dict(extra).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def chunk(self, data:bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                request = json.loads(raw)
+                with stub._lock:
+                    stub.requests += 1
+                    stub.prompt_bytes += len(raw)
+                time.sleep(stub.latency + random.uniform(0, stub.jitter))
+                if random.random() < stub.error_rate:
+                    return self.reply(503, {"error": {"message": "stub failure", "type": "server_error"}}, {"retry-after-ms": "100"})
+                content = make_reply(request["messages"])
+                prompt = prompt_stream(request["messages"])
+                prompt_tokens, completion_tokens = len(prompt) // BYTES_PER_TOKEN, len(content) // BYTES_PER_TOKEN
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens,
+                         "prompt_tokens_details": {"cached_tokens": stub.cached_tokens(prompt)}}
+                base = {"id": "chatcmpl-" + uuid.uuid4().hex[:12], "created": int(time.time()), "model": request["model"]}
+                if not request.get("stream"):
+                    body = dict(base, object="chat.completion", usage=usage, choices=[
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}])
+                    data = json.dumps(body).encode()
+                    self.headers_out(200, "application/json", len(data))
+                    self.wfile.write(data)
+                    return
+                self.headers_out(200, "text/event-stream")
+                chunks = [{"choices": [{"index": 0, "delta": {"content": content[i:i + stub.chunk_chars]}, "finish_reason": None}]}
+                          for i in range(0, len(content), stub.chunk_chars)]
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    chunks.append({"choices": [], "usage": usage})
+                for c in chunks:
+                    self.chunk(b"data: " + json.dumps(dict(base, object="chat.completion.chunk", **c)).encode() + b"\n\n")
+                self.chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+        return Handler
+
+    def serve(self, host:str = "127.0.0.1", port:int = 0) -> ThreadingHTTPServer:
+        # Runs in a daemon thread; the bound port is server.server_address[1]
+        server = ThreadingHTTPServer((host, port), self.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI chat completions stand-in")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds before every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds added at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+    server = OpenAIStub(args.latency, args.jitter, args.error_rate).serve(port=args.port)
+    print(f"OpenAI stub on http://127.0.0.1:{server.server_address[1]}/v1")
+    threading.Event().wait()
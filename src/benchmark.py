@@ -0,0 +1,161 @@
+"""
+Offline benchmark: synthetic PDFs through agent.run against local OpenAI and
+Mathpix stand-ins, no network access or API keys needed.
+
+    python src/benchmark.py --sizes 5,20 --latency 1.0 --jitter 0.5 --error-rate 0.02
+
+Every scenario (engine x size x repeat) runs in a fresh process with its own
+cache directories, so peak RSS and cache behaviour are per scenario; use
+--repeat 2 --keep-cache to measure warm-cache reruns. Results are printed as a
+table and written to --out as JSON.
+"""
+import os,sys,json,math,time,shutil,argparse,resource,tempfile,subprocess
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINES = {"openai": "OpenAI (cloud)", "mathpix": "Mathpix (cloud)"}
+COMPILE_STAGES = ("preamble_format", "compile_pass", "page_checks")
+
+def percentile(values: list, q: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+def run_scenario(scenario: dict) -> dict:
+    # Child process: one agent.run with the settings in scenario
+    from agent import run as agent_run
+    from utils.profiler import read_trace
+    from utils.job_spec import JobSpec
+    out_dir = os.path.join(scenario["work_dir"], "out")
+    os.makedirs(out_dir, exist_ok=True)
+    job = JobSpec(
+        engine_choice=ENGINES[scenario["engine"]],
+        app_id="benchmark",
+        api_key="benchmark",
+        base_url=scenario["base_url"],
+        pdf_path=scenario["pdf_path"],
+        out_dir=out_dir,
+        pages_arg=f"1-{scenario['pages']}",
+        title="Benchmark",
+        model="stub",
+        max_workers=scenario["max_workers"],
+        text_layer=scenario["text_layer"],
+        batch_size=scenario["batch_size"],
+        stream=scenario["stream"],
+        chunk_size=scenario["chunk_size"],
+    )
+    result = {"error": None}
+    start = time.perf_counter()
+    try:
+        agent_run(job)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    result["peak_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    trace = read_trace(out_dir) or {"stages": {}, "pages": {}}
+    latencies = [p["api_seconds"] for p in trace["pages"].values() if "api_seconds" in p]
+    result["page_latency_p50"] = percentile(latencies, 0.50)
+    result["page_latency_p99"] = percentile(latencies, 0.99)
+    result["prompt_tokens"] = sum(p.get("prompt_tokens", 0) for p in trace["pages"].values())
+    result["cached_tokens"] = sum(p.get("cached_tokens", 0) for p in trace["pages"].values())
+    # Every page sent to the model is in an api span; a cold run needs one
+    # request per batch of them, more means batches were split up again
+    result["requests"] = trace["stages"].get("api", {}).get("count", 0)
+    result["expected_requests"] = math.ceil(sum("api_seconds" in p for p in trace["pages"].values()) / max(1, scenario["batch_size"]))
+    result["compile_seconds"] = sum(trace["stages"].get(s, {}).get("seconds", 0.0) for s in COMPILE_STAGES)
+    result["stages"] = {name: round(s["seconds"], 4) for name, s in trace["stages"].items()}
+    result["pdf_built"] = os.path.exists(os.path.join(out_dir, "master.pdf"))
+    return result
+
+def spawn(scenario: dict, cache_dir: str) -> dict:
+    env = dict(os.environ,
+               LATEXTRANS_CACHE_DIR=os.path.join(cache_dir, "translation_cache"),
+               LATEXTRANS_OFFICE_PROFILE_DIR=os.path.join(cache_dir, "office_profiles"),
+               PYTHONPATH=SRC_DIR)
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--scenario", json.dumps(scenario)],
+                          cwd=cache_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # The pipeline prints its progress; the result is the last line
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"}
+    return json.loads(lines[-1])
+
+def print_table(rows: list):
+    columns = [("engine", "{}"), ("pages", "{}"), ("run", "{}"), ("seconds", "{:.2f}"), ("pages_per_sec", "{:.2f}"),
+               ("page_latency_p50", "{:.2f}"), ("page_latency_p99", "{:.2f}"), ("peak_rss_mib", "{:.0f}"), ("compile_seconds", "{:.2f}"), ("requests", "{}"),
+               ("prompt_tokens", "{:.0f}"), ("cached_share", "{:.0%}")]
+    cells = [[name for name, _ in columns]]
+    for row in rows:
+        cells.append([fmt.format(row[name]) if row.get(name) is not None else "-" for name, fmt in columns])
+    widths = [max(len(r[i]) for r in cells) for i in range(len(columns))]
+    for r in cells:
+        print("  ".join(c.rjust(w) for c, w in zip(r, widths)))
+    for row in rows:
+        if row.get("error"):
+            print(f"{row['engine']} {row['pages']} pages run {row['run']} failed: {row['error']}")
+        elif row["engine"] == "openai" and row.get("requests", 0) > row.get("expected_requests", 0):
+            print(f"{row['engine']} {row['pages']} pages run {row['run']}: {row['requests']} requests, "
+                  f"expected {row['expected_requests']}; batched replies could not be split")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark against local API stand-ins")
+    parser.add_argument("--engines", default="openai", help="comma separated: openai, mathpix")
+    parser.add_argument("--sizes", default="5,20", help="comma separated page counts")
+    parser.add_argument("--kinds", default="text,math,figure,cjk,scanned", help="page kinds, cycled through")
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per model request")
+    parser.add_argument("--jitter", type=float, default=0.5, help="up to this many extra seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 503")
+    parser.add_argument("--mathpix-processing", type=float, default=2.0, help="seconds until a Mathpix upload is done")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=0, help="Mathpix pages per upload, 0 for one upload")
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--no-text-layer", action="store_true")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--keep-cache", action="store_true", help="share the translation cache between repeats")
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        return
+
+    from api.openai_stub import OpenAIStub
+    from api.mathpix_stub import MathpixStub
+    from utils.synthetic_pdf import make_pdf
+    openai_server = OpenAIStub(args.latency, args.jitter, args.error_rate).serve()
+    mathpix_server = MathpixStub(args.mathpix_processing, error_rate=args.error_rate).serve()
+    base_urls = {"openai": f"http://127.0.0.1:{openai_server.server_address[1]}/v1",
+                 "mathpix": f"http://127.0.0.1:{mathpix_server.server_address[1]}/v3"}
+
+    rows = []
+    work_root = tempfile.mkdtemp(prefix="latextrans-bench-")
+    try:
+        for engine in args.engines.split(","):
+            for size in map(int, args.sizes.split(",")):
+                pdf_path = make_pdf(os.path.join(work_root, f"synthetic_{size}.pdf"), size, args.kinds.split(","))
+                cache_dir = None
+                for run in range(1, args.repeat + 1):
+                    if cache_dir is None or not args.keep_cache:
+                        cache_dir = tempfile.mkdtemp(dir=work_root)
+                    scenario = {"engine": engine, "pages": size, "pdf_path": pdf_path, "base_url": base_urls[engine],
+                                "work_dir": tempfile.mkdtemp(dir=work_root), "max_workers": args.max_workers,
+                                "batch_size": args.batch_size, "chunk_size": args.chunk_size, "stream": not args.no_stream,
+                                "text_layer": not args.no_text_layer}
+                    result = spawn(scenario, cache_dir)
+                    row = dict(engine=engine, pages=size, run=run, **result)
+                    if row.get("seconds"):
+                        row["pages_per_sec"] = size / row["seconds"]
+                    if row.get("prompt_tokens"):
+                        row["cached_share"] = row["cached_tokens"] / row["prompt_tokens"]
+                    rows.append(row)
+                    print(f"{engine} {size} pages run {run}: {row.get('seconds', 0):.2f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    print_table(rows)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"settings": {k: v for k, v in vars(args).items() if k != "scenario"}, "results": rows}, f, indent=2)
+    print(f"Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Headless batch conversion, without Streamlit.
+
+    python src/cli.py papers/ --out-dir out --pages 1-10 --jobs 2 --max-requests 8
+    python src/cli.py paper.pdf other.pdf --engine mathpix
+    python src/cli.py manifest.jsonl --summary nightly.json
+
+Inputs are PDF files, directories (every *.pdf inside, sorted) or manifests:
+a .txt with one PDF path per line, or a .jsonl with one object per line
+({"pdf": path, and optionally "pages", "title", "language", "prompt"}).
+Relative paths in a manifest are relative to the manifest. Every document
+gets its own directory under --out-dir. --jobs documents run at the same time
+and they share one limit of --max-requests API requests in flight.
+API keys are read from the arguments or from OPENAI_API_KEY, or
+MATHPIX_APP_ID and MATHPIX_APP_KEY.
+"""
+import os,sys,json,time,argparse,traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from constants.constants import MAX_CONCURRENCY,BATCH_SIZE,MATHPIX_BASE_URL,MAX_REQUESTS_IN_FLIGHT,cor
+
+ENGINES = {"openai": "OpenAI (cloud)", "mathpix": "Mathpix (cloud)"}
+
+def read_manifest(path: str) -> list:
+    base = os.path.dirname(os.path.abspath(path))
+    docs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            doc = json.loads(line) if path.endswith(".jsonl") else {"pdf": line}
+            doc["pdf"] = os.path.join(base, doc["pdf"])
+            docs.append(doc)
+    return docs
+
+def collect_documents(inputs: list) -> list:
+    docs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            docs += [{"pdf": os.path.join(item, name)} for name in sorted(os.listdir(item)) if name.lower().endswith(".pdf")]
+        elif item.lower().endswith(".pdf"):
+            docs.append({"pdf": item})
+        elif os.path.isfile(item):
+            docs += read_manifest(item)
+        else:
+            raise Exception(f"No such PDF, directory or manifest: {item}")
+    return docs
+
+def document_dirs(docs: list, out_root: str) -> list:
+    # One directory per document, named after the file; clashing names get a suffix
+    seen = {}
+    dirs = []
+    for doc in docs:
+        stem = os.path.splitext(os.path.basename(doc["pdf"]))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        dirs.append(os.path.join(out_root, stem if seen[stem] == 1 else f"{stem}-{seen[stem]}"))
+    return dirs
+
+def build_spec(args, doc: dict, out_dir: str):
+    from utils.job_spec import JobSpec
+    engine = ENGINES[args.engine]
+    if args.engine == "openai":
+        api_key = args.api_key or os.environ.get("OPENAI_API_KEY", "")
+        base_url = args.base_url or os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        app_id = None
+    else:
+        api_key = args.api_key or os.environ.get("MATHPIX_APP_KEY", "")
+        base_url = args.base_url or MATHPIX_BASE_URL
+        app_id = args.app_id or os.environ.get("MATHPIX_APP_ID", "")
+    return JobSpec(
+        engine_choice=engine,
+        app_id=app_id,
+        base_url=base_url,
+        pages_arg=doc.get("pages", args.pages),
+        title=doc.get("title") or args.title or os.path.splitext(os.path.basename(doc["pdf"]))[0],
+        api_key=api_key,
+        user_prompt=doc.get("prompt", args.prompt),
+        language_selected=doc.get("language", args.language),
+        content_page=args.toc,
+        max_workers=args.max_workers,
+        adaptive_encoding=not args.no_adaptive_encoding,
+        text_layer=not args.no_text_layer,
+        batch_size=args.batch_size,
+        stream=args.stream,
+        dedup_pages=not args.no_dedup,
+        collapse_builds=args.collapse_builds,
+        chunk_size=args.chunk_size,
+        model=args.model,
+        pdf_path=os.path.abspath(doc["pdf"]),
+        out_dir=os.path.abspath(out_dir),
+    )
+
+def convert(args, doc: dict, out_dir: str) -> dict:
+    from agent import run as agent_run
+    from utils.profiler import read_trace
+    from events import EventBus,EventLog,Progress,read_progress
+    out_dir = os.path.abspath(out_dir)
+    result = {"pdf": os.path.abspath(doc["pdf"]), "out_dir": out_dir, "status": "done", "error": None}
+    start = time.perf_counter()
+    try:
+        spec = build_spec(args, doc, out_dir)
+        os.makedirs(out_dir, exist_ok=True)
+        events = EventBus([Progress(os.path.join(out_dir, "progress.json")),
+                           EventLog(os.path.join(out_dir, "events.jsonl"))])
+        try:
+            agent_run(spec, events)
+            events.publish("run_finished")
+        finally:
+            events.close()
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+        print(traceback.format_exc(), file=sys.stderr)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    outputs = ("master.tex", "master.pdf", "master.docx", "master.tex.zip")
+    result["outputs"] = [name for name in outputs if os.path.exists(os.path.join(out_dir, name))]
+    result["progress"] = read_progress(os.path.join(out_dir, "progress.json"))
+    trace = read_trace(out_dir)
+    if trace:
+        result["pages"] = len(trace["pages"])
+        result["stages"] = {name: round(s["seconds"], 3) for name, s in trace["stages"].items()}
+    return result
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert PDFs to LaTeX without the web UI")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories of PDFs or manifests (.txt / .jsonl)")
+    parser.add_argument("--out-dir", default="translated_output")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="openai")
+    parser.add_argument("--model", default=os.environ.get("OPENAI_MODEL", "gpt-4o"))
+    parser.add_argument("--base-url", help="API endpoint; defaults to OPENAI_BASE_URL or the engine's public API")
+    parser.add_argument("--api-key")
+    parser.add_argument("--app-id", help="Mathpix app_id")
+    parser.add_argument("--pages", default="1-999", help='e.g. "11", "11-14", "3,5,9-12"')
+    parser.add_argument("--title", help="document title; defaults to the file name")
+    parser.add_argument("--language", default="", choices=sorted(cor), help="translate into this language")
+    parser.add_argument("--prompt", default="", help="extra instructions for the model")
+    parser.add_argument("--toc", action="store_true", help="generate a table of contents")
+    parser.add_argument("--jobs", type=int, default=2, help="documents converted at the same time")
+    parser.add_argument("--max-workers", type=int, default=MAX_CONCURRENCY, help="requests in flight per document")
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS_IN_FLIGHT,
+                        help="model and Mathpix requests in flight across all documents, 0 for no limit")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="pages per request")
+    parser.add_argument("--chunk-size", type=int, default=0, help="Mathpix pages per upload, 0 for one upload")
+    parser.add_argument("--stream", action="store_true", help="stream completions and write live previews")
+    parser.add_argument("--no-adaptive-encoding", action="store_true")
+    parser.add_argument("--no-text-layer", action="store_true")
+    parser.add_argument("--no-dedup", action="store_true", help="translate blank and repeated pages too")
+    parser.add_argument("--collapse-builds", action="store_true", help="keep only the final build of step-by-step slides")
+    parser.add_argument("--summary", help="write a JSON summary here (default: <out-dir>/summary.json)")
+    parser.add_argument("--quiet", action="store_true", help="only print the per-document results")
+    args = parser.parse_args(argv)
+
+    import utils.misc
+    from api.limits import limit_requests
+    utils.misc.__DEBUG__ = not args.quiet
+    limit_requests(args.max_requests)
+
+    docs = collect_documents(args.inputs)
+    if not docs:
+        print("No PDFs found.", file=sys.stderr)
+        return 1
+    started = datetime.now()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        results = []
+        for result in pool.map(lambda item: convert(args, *item), zip(docs, document_dirs(docs, args.out_dir))):
+            print(f"[{result['status']}] {result['pdf']} -> {result['out_dir']} ({result['seconds']:.1f}s)"
+                  + (f": {result['error']}" if result["error"] else ""), file=sys.stderr)
+            results.append(result)
+
+    summary = {
+        "started": started.isoformat(),
+        "finished": datetime.now().isoformat(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("api_key", "app_id")},
+        "documents": results,
+        "failed": sum(r["status"] == "failed" for r in results),
+    }
+    summary_path = args.summary or os.path.join(args.out_dir, "summary.json")
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"{len(results) - summary['failed']} of {len(results)} documents converted, summary in {summary_path}", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
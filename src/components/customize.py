@@ -1,4 +1,5 @@
 import streamlit as st
+from constants.constants import MAX_CONCURRENCY,MAX_CONCURRENCY_LIMIT,BATCH_SIZE,BATCH_SIZE_LIMIT,MATHPIX_CHUNK_LIMIT
 def customize(engine_choice:str) -> dict:
     if (engine_choice!="Mathpix (cloud)"):
         with st.expander("Customization Settings", expanded = True): 
@@ -8,10 +9,36 @@ def customize(engine_choice:str) -> dict:
                 languages = ["English","Chinese","Spanish","Japanese","Korean","Other"]
                 language_selected = st.selectbox("Language To Translate",languages)
             content_page = st.checkbox("Generate Table of Content",value=False)
+            max_workers = st.number_input("Pages Translated In Parallel",min_value=1,max_value=MAX_CONCURRENCY_LIMIT,value=MAX_CONCURRENCY,
+                                          help="Maximum number of pages sent to the model at the same time.")
+            adaptive_encoding = st.checkbox("Adaptive Page Encoding",value=True,
+                                            help="Send text-only pages at a lower resolution and in grayscale.")
+            text_layer = st.checkbox("Use PDF Text Layer",value=True,
+                                     help="Send the exact text of born-digital pages; pages without math or drawings skip the image.")
+            batch_size = st.number_input("Pages Per Request",min_value=1,max_value=BATCH_SIZE_LIMIT,value=BATCH_SIZE,
+                                         help="Send several consecutive pages in one request to save the per-request prompt overhead.")
+            stream = st.checkbox("Live Preview",value=True,
+                                 help="Stream the LaTeX of pages in flight and stop early on output that would be stripped anyway.")
+            dedup_pages = st.checkbox("Skip Repeated Pages",value=True,
+                                      help="Leave out blank pages and reuse the LaTeX of pages that repeat an earlier page.")
+            collapse_builds = st.checkbox("Collapse Slide Builds",value=False,
+                                          help="Keep only the final version of a slide revealed step by step over consecutive pages.")
+    else:
+        with st.expander("Upload Settings", expanded = True):
+            chunk_size = st.number_input("Pages Per Upload",min_value=0,max_value=MATHPIX_CHUNK_LIMIT,value=0,
+                                         help="Split large selections into uploads of this many pages, processed in parallel. 0 uploads everything at once.")
     return {
-        "user_prompt":locals().get("user_prompt"),
+        "user_prompt":locals().get("user_prompt") or "",
         "language_selected": locals().get("language_selected") or "",
-        "content_page":locals().get("content_page"),
+        "content_page":bool(locals().get("content_page")),
+        "max_workers":locals().get("max_workers") or MAX_CONCURRENCY,
+        "adaptive_encoding":locals().get("adaptive_encoding",True),
+        "text_layer":locals().get("text_layer",True),
+        "batch_size":locals().get("batch_size") or BATCH_SIZE,
+        "stream":locals().get("stream",True),
+        "dedup_pages":locals().get("dedup_pages",True),
+        "collapse_builds":bool(locals().get("collapse_builds")),
+        "chunk_size":locals().get("chunk_size") or 0,
     }
 
 
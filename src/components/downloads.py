@@ -1,64 +1,32 @@
-import zipfile
+import os
+import html
 import streamlit as st
-def downloads(out_dir:str):
-    # Offer downloads if present
-    master_tex = out_dir / "master.tex"
-    master_pdf = out_dir / "master.pdf"
-    master_zip = out_dir / "master.zip"
-    master_docx = out_dir / "master.docx"
-    master_latex_zip = out_dir / "master.tex.zip"
-    page_files = sorted(out_dir.glob("page_*.tex"))
+from utils.packaging import build_archive,publish,published,published_url
+from constants.constants import STATIC_MAX_BYTES
 
-    with zipfile.ZipFile(master_zip, 'w', zipfile.ZIP_DEFLATED, False) as zipf: 
-        if master_tex.exists():
-            zipf.write(master_tex,arcname=master_tex.name)
-        if master_pdf.exists():
-            zipf.write(master_pdf,arcname=master_pdf.name)
-        if page_files:
-            for p in page_files:
-                zipf.write(p,arcname=p.name) 
-        if master_docx.exists():
-            zipf.write(master_docx,arcname=master_docx.name)
-        if master_latex_zip.exists():
-            zipf.write(master_latex_zip,arcname=master_latex_zip.name)
+MIME = {
+    ".zip": "application/zip",
+    ".tex": "text/x-tex",
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
 
-    with open(master_zip, "rb") as file:
-        st.download_button(
-            "Download master.zip",
-            data=file,
-            file_name="master.zip",
-            mime="application/zip"
-        )
-
-    if master_tex.exists():
-        st.download_button(
-            "Download master.tex",
-            data=master_tex.read_bytes(),
-            file_name="master.tex",
-            mime="text/x-tex",
-        )
-
-    if master_pdf.exists():
-        st.download_button(
-            "Download master.pdf",
-            data=master_pdf.read_bytes(),
-            file_name="master.pdf",
-            mime="application/pdf",
-        )
-    
-    if master_docx.exists():
-        st.download_button(
-            "Download master.docx",
-            data=master_docx.read_bytes(),
-            file_name="master.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document" 
-        )
-    if master_latex_zip.exists():
-        with open(master_latex_zip,"rb") as file:
-            st.download_button(
-                "Download master.tex.zip",
-                data=file,
-                file_name="master.tex.zip",
-                mime="application/zip",
-            )
+def downloads(out_dir:str, job_id:str):
+    # Jobs finished before packaging existed are packaged on first view
+    files = published(job_id)
+    if "master.zip" not in files:
+        build_archive(str(out_dir))
+        publish(job_id, str(out_dir))
+        files = published(job_id)
 
+    static = st.get_option("server.enableStaticServing")
+    for name, path in files.items():
+        label = f"Download {name}"
+        if static and os.path.getsize(path) <= STATIC_MAX_BYTES:
+            # A plain link: the browser fetches the file from disk, nothing is held in the session
+            st.markdown(f'<a href="{html.escape(published_url(job_id, name))}" download="{html.escape(name)}">{label}</a>',
+                        unsafe_allow_html=True)
+        else:
+            with open(path, "rb") as file:
+                st.download_button(label, data=file, file_name=name, mime=MIME[os.path.splitext(name)[1]],
+                                   key=f"download-{job_id}-{name}")
@@ -0,0 +1,20 @@
+import streamlit as st
+from utils.preview import read_previews
+def live_preview(out_dir:str, show_partial:bool = True):
+    previews = read_previews(str(out_dir))
+    if not previews:
+        return
+    label = lambda p: ", ".join(map(str, p["pages"]))
+    rate = lambda p: f"{p['tokens_per_sec']:.0f}" if p["tokens_per_sec"] else "–"
+    ttft = lambda p: f"{p['ttft']:.1f}s" if p["ttft"] is not None else "–"
+    if show_partial:
+        for p in previews:
+            if not p["done"] and p["partial"]:
+                st.caption(f"Page {label(p)} • first token {ttft(p)} • {rate(p)} tokens/s")
+                # Only the tail: the page keeps growing while it streams
+                st.code(p["partial"][-1500:], language="latex")
+    st.dataframe(
+        [{"Page": label(p), "First token": ttft(p), "Tokens/s": rate(p), "Seconds": f"{p['seconds']:.1f}",
+          "Status": "done" if p["done"] else "streaming", "Retried": p["retried"] or ""} for p in previews],
+        hide_index=True, use_container_width=True,
+    )
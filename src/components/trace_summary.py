@@ -0,0 +1,26 @@
+import os
+import streamlit as st
+from utils.profiler import read_trace,CHROME_TRACE_FILE
+def trace_summary(out_dir:str):
+    trace = read_trace(str(out_dir))
+    if not trace:
+        return
+    wall = trace["wall_seconds"] or 1.0
+    st.caption(f"Wall time {trace['wall_seconds']:.1f}s. Stages running on several threads can add up to more than that.")
+    st.dataframe(
+        [{"Stage": name, "Calls": s["count"], "Seconds": f"{s['seconds']:.2f}", "Share": f"{100 * s['seconds'] / wall:.0f}%",
+          "Slowest": f"{s['max_seconds']:.2f}"} for name, s in trace["stages"].items()],
+        hide_index=True, use_container_width=True,
+    )
+    total = lambda key: sum(p.get(key, 0) for p in trace["pages"].values())
+    st.write(f"Sent {total('request_bytes') / 1024:.0f} KiB in requests, "
+             f"{total('prompt_tokens'):.0f} prompt ({total('cached_tokens'):.0f} cached) and {total('completion_tokens'):.0f} completion tokens.")
+    chrome_trace = os.path.join(str(out_dir), CHROME_TRACE_FILE)
+    if os.path.exists(chrome_trace):
+        with open(chrome_trace, "rb") as file:
+            st.download_button(
+                "Download trace (chrome://tracing, Perfetto)",
+                data=file,
+                file_name=CHROME_TRACE_FILE,
+                mime="application/json",
+            )
@@ -1,3 +1,4 @@
+import os
 # --- Prompts ---
 SYSTEM_LATEX = """You are a LaTeX writer. Convert the given math lecture page into clean, compilable LaTeX.
 - Do NOT include any handwritten artifacts or images of text.
@@ -27,6 +28,60 @@ Instructions:
 - Target language varies, English if not specified
 """
 
+TEXT_LAYER_MSG = """Recognize and translate the page into a latex file
+The page is born-digital: its exact text layer is given below instead of an image.
+Markup in the text layer:
+- Lines starting with "# " are set larger than the body text (likely headings).
+- <b>...</b> is bold and <i>...</i> is italic text.
+Instructions:
+- Output ONLY LaTeX body content for this page.
+- Keep the wording exactly as given; only translate it if a target language is requested.
+- Use \\section*{{...}} or \\subsection*{{...}} for headings you detect.
+- Ensure the output compiles in a standard article preamble.
+"""
+
+HYBRID_MSG = """Recognize and translate the pdf into a latex file
+The page's exact text layer is given below together with a reduced image of the page.
+Markup in the text layer:
+- Lines starting with "# " are set larger than the body text (likely headings).
+- <b>...</b> is bold, <i>...</i> is italic and <m>...</m> is set in a math font.
+Instructions:
+- Output ONLY LaTeX body content for this page.
+- Take the characters from the text layer; use the image for layout, formulas and figures.
+- Wrap displayed equations in equation/align as appropriate.
+- Use \\section*{{...}} or \\subsection*{{...}} for headings you detect.
+- If appropriate, add a small TikZ sketch that matches the page's figure(s).
+- Ensure the output compiles in a standard article preamble.
+- Target language varies, English if not specified
+"""
+
+BATCH_MSG = """Recognize and translate the following {count} pdf pages ({pages}) into latex files
+Each page starts with a line "--- PAGE n ---" followed by the page image and/or its exact text layer.
+Markup in text layers: lines starting with "# " are larger text (likely headings),
+<b>...</b> is bold, <i>...</i> is italic and <m>...</m> is set in a math font.
+Instructions:
+- Translate every page separately and keep the given order.
+- Begin each page's output with a line %%% BEGIN PAGE n %%% and end it with a line %%% END PAGE n %%%, where n is the page number.
+- Between the two lines output ONLY LaTeX body content for that page.
+- Wrap displayed equations in equation/align as appropriate.
+- Use \\section*{{...}} or \\subsection*{{...}} for headings you detect.
+- If appropriate, add a small TikZ sketch that matches the page's figure(s).
+- Ensure the output compiles in a standard article preamble.
+- Target language varies, English if not specified
+"""
+
+RETRY_REMINDER = """
+IMPORTANT: a previous answer for this request was rejected ({reason}).
+Return ONLY LaTeX body content: no CJK environment, no \\documentclass or \\begin{{document}}, no ``` fences.
+"""
+
+REPAIR_REMINDER = """
+IMPORTANT: a previous answer for this page did not compile with XeLaTeX:
+{errors}
+Return a corrected LaTeX body: balanced braces, environments and math, no \\usepackage or \\includegraphics,
+only commands of the standard packages listed above.
+"""
+
 CONTENT_PAGE = r"""
 - Before generating section headers, add \phantomsection\addcontentsline{toc}{section}{...} to include them in the ToC.
 - Before generating subsection headers, add \phantomsection\addcontentsline{toc}{subsection}{...} to include them in the ToC.
@@ -53,4 +108,97 @@ HEADING_PATTERNS = [
     (r'\\section\*\{([^}]*)\}',       r'section'),
     (r'\\subsection\*\{([^}]*)\}',    r'subsection'),
     (r'\\subsubsection\*\{([^}]*)\}', r'subsubsection'),
-]
\ No newline at end of file
+]
+
+# ------------ Concurrency -------------------
+MAX_CONCURRENCY = 4   # default number of pages in flight
+MAX_CONCURRENCY_LIMIT = 16
+PREFETCH_PAGES = 2    # pages rendered ahead of the ones in flight
+BATCH_SIZE = 1        # default number of pages per request
+BATCH_SIZE_LIMIT = 8
+
+# ------------ Translation cache -------------------
+CACHE_DIR = os.environ.get("LATEXTRANS_CACHE_DIR", "./translation_cache")
+CACHE_MAX_BYTES = int(os.environ.get("LATEXTRANS_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# ------------ Page image encoding -------------------
+# Vision models downscale anything past ~768px on the short side, so only
+# pages with figures or scans keep the full resolution and colour.
+ENCODING_PROFILES = {
+    "scanned": {"max_width": 1600, "jpg_quality": 80, "grayscale": True, "format": "jpg", "detail": "auto"},
+    "figure":  {"max_width": 1600, "jpg_quality": 80, "grayscale": True, "format": "png", "detail": "auto"},
+    "text":    {"max_width": 1024, "jpg_quality": 70, "grayscale": True, "format": "jpg", "detail": "auto"},
+    "sparse":  {"max_width": 768,  "jpg_quality": 70, "grayscale": True, "format": "jpg", "detail": "low"},
+    # image sent next to the exact text layer, only needed for layout and formulas
+    "hybrid":  {"max_width": 1024, "jpg_quality": 70, "grayscale": True, "format": "jpg", "detail": "auto"},
+}
+SPARSE_TEXT_CHARS = 300       # fewer non-space characters than this fits a low-detail image
+COLOR_PIXEL_RATIO = 0.005     # share of coloured thumbnail pixels that keeps a page in colour
+
+# ------------ Text layer -------------------
+MATH_FONT_PATTERN = r"CMMI|CMSY|CMEX|CMBSY|MSAM|MSBM|EUFM|EUSM|RSFS|STIX|Math|Symbol|MTExtra|MT Extra|Euclid"
+MATH_CHAR_PATTERN = "[\u0370-\u03ff\u2200-\u22ff\u2190-\u21ff\u27c0-\u27ef\u2980-\u2aff\U0001d400-\U0001d7ff]"
+
+# ------------ Repeated pages -------------------
+DEDUP_HASH_SIZE = 16        # dHash of a 16x16 grid, 256 bits
+DEDUP_MAX_DISTANCE = 16     # differing bits between two renderings of the same page with the same text
+BUILD_MAX_DISTANCE = 64     # differing bits between two builds of one slide
+BLANK_INK_RATIO = 0.003     # share of dark thumbnail pixels below which a page without text is blank
+
+# ------------ Compilation -------------------
+# write_master puts this comment before every page body, so errors in master.tex can be traced to a page
+PAGE_MARKER = "% --- page_{pno:03d}.tex ---\n"
+PAGE_MARKER_PATTERN = r"% --- page_(\d+)\.tex ---$"
+REPAIR_MAX_ERRORS = 5   # errors quoted to the model when a page that does not compile is translated again
+MAX_COMPILE_PASSES = 5
+COMPILE_LOG_TAIL_LINES = 40   # of the engine output kept in the job record when the document does not compile
+RERUN_PATTERN = r"Rerun to get|Label\(s\) may have changed|Please rerun LaTeX"
+FORMAT_CACHE_DIR = os.environ.get("LATEXTRANS_FORMAT_DIR", "./format_cache")
+FORMAT_RETRY_SECONDS = 24 * 3600   # a format that could not be built is tried again after this
+# Everything before this marker is dumped into the precompiled preamble format;
+# without the format it expands to \relax
+ENDOFDUMP = r"\csname endofdump\endcsname"
+
+# ------------ Jobs -------------------
+JOBS_DIR = os.environ.get("LATEXTRANS_JOBS_DIR", "./jobs")
+OUTPUT_DIR = os.environ.get("LATEXTRANS_OUTPUT_DIR", "./translated_output")
+JOB_WORKERS = int(os.environ.get("LATEXTRANS_JOB_WORKERS", "2"))
+JOB_RETENTION_HOURS = int(os.environ.get("LATEXTRANS_JOB_RETENTION_HOURS", "24"))
+JOB_POLL_SECONDS = 1.0
+EVENT_FLUSH_SECONDS = 0.25   # job events are delivered to subscribers in batches at most this often
+EVENT_BATCH_SIZE = 256
+
+# ------------ Downloads -------------------
+# Streamlit serves <main script dir>/static at app/static/ when
+# server.enableStaticServing is on; finished jobs are published there
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+STATIC_URL = "app/static"
+STATIC_MAX_BYTES = 200 * 1024 * 1024   # larger files are refused by Streamlit's static handler
+
+# ------------ API client -------------------
+MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# Model and Mathpix requests in flight across all documents of the process; 0 = no limit
+MAX_REQUESTS_IN_FLIGHT = int(os.environ.get("LATEXTRANS_MAX_REQUESTS", "16"))
+# Clients (connection pools) kept per endpoint and key; unused ones are dropped
+CLIENT_MAX_CACHED = 16
+CLIENT_IDLE_SECONDS = 600
+PREVIEW_INTERVAL_SECONDS = 0.5   # how often the partial LaTeX of a page is written out
+STREAM_CHECK_CHARS = 32   # earlier output checked with each streamed delta, longer than anything bad_output_reason looks for
+
+# ------------ Mathpix -------------------
+MATHPIX_BASE_URL = "https://api.mathpix.com/v3"
+MATHPIX_POLL_MIN_SECONDS = 0.5
+MATHPIX_POLL_MAX_SECONDS = 8.0
+MATHPIX_POLL_FACTOR = 1.5
+MATHPIX_MAX_CONCURRENT = 4   # chunks of one document processed at the same time
+MATHPIX_CHUNK_LIMIT = 200
+
+# ------------ LibreOffice (docx -> pdf) -------------------
+OFFICE_BINARY = os.environ.get("LATEXTRANS_OFFICE_BINARY", "soffice")
+OFFICE_WORKERS = int(os.environ.get("LATEXTRANS_OFFICE_WORKERS", "2"))
+OFFICE_PROFILE_DIR = os.environ.get("LATEXTRANS_OFFICE_PROFILE_DIR", "./office_profiles")
+OFFICE_TIMEOUT_SECONDS = 180
+OFFICE_START_SECONDS = 60    # for a worker's instance to accept connections
+OFFICE_BASE_PORT = int(os.environ.get("LATEXTRANS_OFFICE_BASE_PORT", "2002"))   # worker i listens on base + i
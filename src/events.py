@@ -0,0 +1,129 @@
+import os,json,time,threading
+from collections import deque
+from typing import Callable, List, Optional
+from constants.constants import EVENT_FLUSH_SECONDS,EVENT_BATCH_SIZE
+from utils.misc import printf
+
+class EventBus:
+    """
+    Structured events of one job. publish() only appends to a queue, so it is
+    cheap from any thread or event loop; a dispatcher thread hands the queued
+    events to every subscriber in batches, at most every EVENT_FLUSH_SECONDS
+    or as soon as EVENT_BATCH_SIZE are waiting. Subscribers are called with a
+    list of events from that one thread, in publish order.
+    """
+    def __init__(self, subscribers: List[Callable[[List[dict]], None]] = ()):
+        self.subscribers = list(subscribers)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._dispatch, name="events", daemon=True)
+        self._thread.start()
+
+    def publish(self, kind: str, **fields):
+        event = dict(fields, kind=kind, time=time.time())
+        with self._cond:
+            self._queue.append(event)
+            if len(self._queue) >= EVENT_BATCH_SIZE:
+                self._cond.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                # Let a burst of events collect until the next delivery is due,
+                # unless a full batch is waiting or the bus is closed
+                deadline = time.monotonic() + EVENT_FLUSH_SECONDS
+                while not self._closed and len(self._queue) < EVENT_BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = list(self._queue)
+                self._queue.clear()
+                closed = self._closed
+            if batch:
+                for subscriber in self.subscribers:
+                    try:
+                        subscriber(batch)
+                    except Exception as e:
+                        printf(f"Event subscriber {subscriber!r} failed: {e}")
+            if closed:
+                return
+
+    def close(self):
+        # Delivers everything published so far, then stops the dispatcher
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+class Progress:
+    """
+    Subscriber keeping the progress and counters of a job, written as a JSON
+    snapshot to path after every batch. Pages are counted once however often
+    they are reported, so retries and resumed runs cannot push past the total.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.pages_total = None
+        self.pages_done = set()
+        self.pages_running = set()
+        self.counters = {"requests": 0, "request_bytes": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+                         "retries": 0, "cache_hits": 0, "compile_passes": 0, "pages_skipped": 0, "pages_repaired": 0}
+        self.stage = None
+
+    def __call__(self, events: List[dict]):
+        for e in events:
+            kind = e["kind"]
+            if kind == "run_started":
+                self.pages_total = e["pages_total"]
+                self.pages_done.update(e.get("pages_resumed", ()))
+                self.stage = "translating"
+            elif kind == "page_started":
+                self.pages_running.add(e["page"])
+            elif kind == "page_finished":
+                self.pages_running.discard(e["page"])
+                self.pages_done.add(e["page"])
+            elif kind == "page_skipped":
+                self.pages_done.add(e["page"])
+                self.counters["pages_skipped"] += 1
+            elif kind == "api":
+                self.counters["requests"] += 1
+                for key in ("request_bytes", "prompt_tokens", "cached_tokens", "completion_tokens", "retries"):
+                    self.counters[key] += e.get(key, 0)
+            elif kind == "cache_lookup":
+                self.counters["cache_hits"] += e.get("cache_hits", 0)
+            elif kind == "page_repaired":
+                self.counters["pages_repaired"] += 1
+            elif kind == "compile_pass":
+                self.counters["compile_passes"] += 1
+                self.stage = "compiling"
+            elif kind == "run_finished":
+                self.stage = "finished"
+        self.write()
+
+    def snapshot(self) -> dict:
+        return {"stage": self.stage, "pages_total": self.pages_total, "pages_done": len(self.pages_done),
+                "pages_running": sorted(self.pages_running), **self.counters}
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.path)
+
+class EventLog:
+    """Subscriber appending every event as one JSON line to path."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, events: List[dict]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(e) + "\n" for e in events)
+
+def read_progress(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,77 @@
+"""
+Import-time budget for the modules loaded at startup.
+
+    python src/importtime_budget.py                  # exit code 1 on a breach
+    python src/importtime_budget.py --top 15 agent   # check one module, list its slowest imports
+
+Every module is imported in fresh interpreters with -X importtime and the
+median cumulative time is compared with its budget. Backends that must only
+load on first use (engine SDKs, PyMuPDF, the compile subsystem) fail the
+check as soon as they show up in a module's import graph.
+"""
+import os,sys,argparse,statistics,subprocess
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Loaded by agent.run for the selected engine only
+BACKENDS = ("openai", "pymupdf", "requests", "logics.openai_logic", "logics.mathpix_logic",
+            "api.openai", "api.mathpix", "utils.page_parser", "utils.compile_pdf")
+
+# module: (budget in milliseconds, modules it must not import)
+BUDGETS = {
+    "agent": (25, BACKENDS),
+    "jobs": (80, BACKENDS),
+    "cli": (80, BACKENDS),
+    "ui": (2000, BACKENDS),
+    "logics.mathpix_logic": (600, ("openai", "api.openai", "utils.compile_pdf")),
+}
+
+def import_profile(module: str) -> tuple:
+    # (cumulative microseconds, {module: cumulative microseconds}) of one cold import
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=SRC_DIR,
+                          env=dict(os.environ, PYTHONPATH=SRC_DIR), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise Exception(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    # Children are listed before their parent; a top-level entry closes a subtree
+    subtree = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        subtree[name.strip()] = int(cumulative)
+        if not name[1:].startswith(" "):
+            if name.strip() == module:
+                return subtree[module], subtree
+            subtree = {}
+    return 0, subtree
+
+def check(module: str, budget_ms: float, forbidden: tuple, runs: int, top: int) -> bool:
+    try:
+        profiles = [import_profile(module) for _ in range(runs)]
+    except Exception as e:
+        print(f"FAIL {module}: {e}")
+        return False
+    median_ms = statistics.median(total for total, _ in profiles) / 1000
+    loaded = profiles[-1][1]
+    leaked = [name for name in forbidden if name in loaded]
+    ok = median_ms <= budget_ms and not leaked
+    print(f"{'ok  ' if ok else 'FAIL'} {module}: {median_ms:.1f} ms (budget {budget_ms:.0f} ms)"
+          + (f", loads {', '.join(leaked)}" if leaked else ""))
+    for name, us in sorted(loaded.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"       {us / 1000:8.1f} ms  {name}")
+    return ok
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the cold import time of the startup modules")
+    parser.add_argument("modules", nargs="*", help=f"default: {', '.join(BUDGETS)}")
+    parser.add_argument("--runs", type=int, default=5, help="cold imports per module, the median counts")
+    parser.add_argument("--top", type=int, default=0, help="list this many of the slowest imports per module")
+    args = parser.parse_args()
+    results = [check(module, *BUDGETS.get(module, (float("inf"), BACKENDS)), args.runs, args.top)
+               for module in args.modules or BUDGETS]
+    return 0 if all(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import os,re,json,uuid,hashlib,shutil,threading,traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from constants.constants import JOBS_DIR,OUTPUT_DIR,JOB_WORKERS,JOB_RETENTION_HOURS
+from utils.misc import printf
+from events import EventBus,EventLog,Progress,read_progress
+from utils.packaging import build_archive,detach_outputs,publish,unpublish
+from utils.job_spec import JobSpec
+
+def process_token(pid: int) -> Optional[str]:
+    # Boot id and start time of a process: unlike the pid, never reused for another process
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r", encoding="utf-8") as f:
+            boot = f.read().strip()
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            started = f.read().rsplit(")", 1)[1].split()[19]
+        return f"{boot}:{started}"
+    except (OSError, IndexError):
+        return None
+
+def job_owner() -> dict:
+    return {"pid": os.getpid(), "token": process_token(os.getpid())}
+
+def owner_alive(owner: Optional[dict]) -> bool:
+    """
+    Whether the process that submitted a job still runs. Records without an
+    owner come from before owners were stored and count as gone; without
+    /proc only this process is known to be alive.
+    """
+    if not owner:
+        return False
+    if owner["pid"] == os.getpid():
+        return owner["token"] == process_token(os.getpid())
+    if owner["token"] is None:
+        return False
+    return process_token(owner["pid"]) == owner["token"]
+
+class JobQueue:
+    """
+    Runs agent pipelines on a bounded worker pool, outside the Streamlit
+    script. Every job has a JSON record in jobs_dir that survives reruns;
+    callers keep the job id and poll get() for status and results. Several
+    processes may share jobs_dir; each record names the process running it.
+    """
+    def __init__(self, jobs_dir: str = JOBS_DIR, output_dir: str = OUTPUT_DIR, max_workers: int = JOB_WORKERS):
+        self.jobs_dir = os.path.abspath(jobs_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._recover()
+        self.prune()
+
+    def _record_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id + ".json")
+
+    def _write(self, record: dict):
+        path = self._record_path(record["id"])
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp, path)
+
+    def _update(self, job_id: str, **fields) -> dict:
+        with self._lock:
+            record = self.get(job_id)
+            record.pop("progress", None)
+            record.update(fields)
+            self._write(record)
+            return record
+
+    def _recover(self):
+        # Jobs of a process that is gone cannot continue: their secrets were
+        # never stored. Jobs of other live processes sharing jobs_dir are left alone
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith(".json"):
+                record = self.get(name[:-5])
+                if record and record["status"] in ("queued", "running") and not owner_alive(record.get("owner")):
+                    record.update(status="failed", error="Interrupted by a server restart", finished=datetime.now().isoformat())
+                    self._write(record)
+
+    def _records(self) -> List[dict]:
+        records = (self.get(name[:-5]) for name in os.listdir(self.jobs_dir) if name.endswith(".json"))
+        return [record for record in records if record]
+
+    def prune(self, max_age: timedelta = timedelta(hours=JOB_RETENTION_HOURS)):
+        cutoff = datetime.now() - max_age
+        records = self._records()
+        expired = [record for record in records
+                   if record["status"] not in ("queued", "running") and datetime.fromisoformat(record["created"]) <= cutoff]
+        # Output directories are shared by resubmissions of the same document
+        in_use = {record["out_dir"] for record in records if record not in expired}
+        for record in expired:
+            shutil.rmtree(os.path.join(self.jobs_dir, record["id"]), ignore_errors=True)
+            unpublish(record["id"])
+            if record["out_dir"] not in in_use:
+                shutil.rmtree(record["out_dir"], ignore_errors=True)
+            os.remove(self._record_path(record["id"]))
+
+    def submit(self, spec: JobSpec, pdf_bytes: bytes, pdf_name: str) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        pdf_path = os.path.join(job_dir, os.path.basename(pdf_name) or "input.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        # Same document and engine, same output directory: the run resumes from its manifest
+        digest = hashlib.sha256(pdf_bytes)
+        digest.update(spec.engine_choice.encode("utf-8"))
+        out_dir = os.path.join(self.output_dir, digest.hexdigest()[:16])
+        # Claiming the directory and writing the record is one step, so two
+        # submissions of the same document never share an out_dir
+        with self._lock:
+            if any(record["out_dir"] == out_dir and record["status"] in ("queued", "running") for record in self._records()):
+                out_dir += "-" + job_id
+            spec = spec.with_paths(pdf_path, out_dir)
+            record = {
+                "id": job_id,
+                "status": "queued",
+                "created": datetime.now().isoformat(),
+                "started": None,
+                "finished": None,
+                "error": None,
+                "pdf_name": pdf_name,
+                "out_dir": out_dir,
+                "pages_total": None,
+                "settings": spec.settings(),
+                "owner": job_owner(),
+            }
+            self._write(record)
+        os.makedirs(out_dir, exist_ok=True)
+        self._pool.submit(self._run, job_id, spec)
+        return job_id
+
+    def _run(self, job_id: str, spec: JobSpec):
+        from agent import run as agent_run
+        from utils.page_parser import count_selected_pages
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        events = EventBus([Progress(os.path.join(job_dir, "progress.json")), EventLog(os.path.join(job_dir, "events.jsonl"))])
+        try:
+            self._update(job_id, status="running", started=datetime.now().isoformat(),
+                         pages_total=count_selected_pages(spec.pdf_path, spec.pages_arg))
+            # Published files of earlier jobs are hard links into out_dir
+            detach_outputs(spec.out_dir)
+            agent_run(spec, events)
+            # Packaged once here; the UI serves the files from disk
+            build_archive(spec.out_dir)
+            publish(job_id, spec.out_dir)
+            events.publish("run_finished")
+            events.close()
+            self._update(job_id, status="done", finished=datetime.now().isoformat())
+        except Exception as e:
+            printf(traceback.format_exc())
+            events.publish("run_failed", error=str(e))
+            events.close()
+            self._update(job_id, status="failed", finished=datetime.now().isoformat(), error=str(e))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        # Ids also come from the page URL; only ones submit() can make name a record
+        if not re.fullmatch(r"[0-9a-f]{12}", job_id or ""):
+            return None
+        try:
+            with open(self._record_path(job_id), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        progress = read_progress(os.path.join(self.jobs_dir, job_id, "progress.json"))
+        if progress:
+            record["progress"] = progress
+        return record
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue() -> JobQueue:
+    # One queue per process, shared by every Streamlit session
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
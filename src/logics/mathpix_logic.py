@@ -1,24 +1,43 @@
-import requests
-import json
-import time
-from api.mathpix import mathpix,mathpix_writeback,mathpix_isprocessing
+import os,glob,shutil
+import asyncio
+from api.mathpix import get_client,mathpix_convert,mathpix_convert_many
 from utils.page_parser import parse_pages_arg,extract_pdf 
+from utils.mathpix_stitch import merge_pdfs,merge_tex_zips
+from constants.constants import MATHPIX_MAX_CONCURRENT
+from utils.misc import printf
 import pymupdf as fitz
-def mathpix_logic(app_id:str, app_key:str, pdf_path:str, out_dir:str, pages_arg:str):
+def mathpix_logic(app_id:str, app_key:str, pdf_path:str, out_dir:str, pages_arg:str, base_url:str = None, chunk_size:int = 0):
     try:
         doc = fitz.open(pdf_path)
         pages = parse_pages_arg(pages_arg,len(doc))  
-        extracted_pdf = extract_pdf(doc,pages,out_dir)
+        client = get_client(app_id=app_id, app_key=app_key, base_url=base_url)
+        # The output directory is reused by reruns; drop artifacts of the other mode
+        for stale in glob.glob(os.path.join(out_dir, "master*.docx")):
+            os.remove(stale)
+        shutil.rmtree(os.path.join(out_dir, "chunks"), ignore_errors=True)
 
-        r = mathpix(app_id=app_id,app_key=app_key,pdf_path=extracted_pdf)    
-        pdf_id = r.json()["pdf_id"]
-        while(mathpix_isprocessing(pdf_id=pdf_id,app_id=app_id,app_key=app_key)):
-            time.sleep(1)
-            
-        mathpix_writeback(pdf_id=pdf_id,app_id=app_id,app_key=app_key,out_dir=out_dir)
+        if not chunk_size or len(pages) <= chunk_size:
+            extracted_pdf = extract_pdf(doc,pages,out_dir)
+            asyncio.run(mathpix_convert(client, extracted_pdf, out_dir))
+            return
+
+        # Large selections: one upload per chunk, all processed at once, then stitched in page order
+        chunks = [pages[i:i + chunk_size] for i in range(0, len(pages), chunk_size)]
+        jobs = []
+        for n, chunk in enumerate(chunks, 1):
+            chunk_dir = os.path.join(out_dir, "chunks", f"{n:02d}")
+            os.makedirs(chunk_dir, exist_ok=True)
+            jobs.append((extract_pdf(doc, chunk, chunk_dir), chunk_dir))
+        printf(f"Uploading {len(pages)} pages to Mathpix in {len(chunks)} chunks")
+        asyncio.run(mathpix_convert_many(client, jobs, MATHPIX_MAX_CONCURRENT))
+
+        chunk_dirs = [chunk_dir for _, chunk_dir in jobs]
+        merge_pdfs([os.path.join(d, "master.pdf") for d in chunk_dirs], os.path.join(out_dir, "master.pdf"))
+        merge_tex_zips([os.path.join(d, "master.tex.zip") for d in chunk_dirs], os.path.join(out_dir, "master.tex.zip"))
+        # Word files cannot be merged without an extra dependency; ship one per chunk
+        for n, d in enumerate(chunk_dirs, 1):
+            os.replace(os.path.join(d, "master.docx"), os.path.join(out_dir, f"master_part_{n:02d}.docx"))
     except Exception as e:
         raise Exception("Mathpix writeback failed. Error: ",e)
     finally:
         doc.close()
-   
-
@@ -1,31 +1,143 @@
 import pymupdf as fitz
-import os,sys,subprocess,argparse
-from utils.page_parser import parse_pages_arg,extract_page
-from utils.compile_pdf import compile_pdf
+import os,re,sys,json,shutil,subprocess,argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import defaultdict
+from utils.page_parser import parse_pages_arg,iter_pages
+from utils.page_dedup import plan_pages
+from utils.compile_pdf import compile_document
 from sanitization.sanitize_llm import sanitize_for_xelatex
-from utils.latex_formatter import make_master_preamble, make_master_epilogue
-from api.openai import openai_api
-from constants.constants import SYSTEM_LATEX,SYSTEM_TOC,USER_MSG,CONTENT_PAGE,cor,HEADING_PATTERNS
-from status import set_total_page,update_status
+from sanitization.latex_repair import repair_body
+from utils.latex_formatter import make_document_head, make_master_epilogue, write_master
+from api.openai import openai_api,ClientMetrics,BadOutputError
+from utils.preview import PagePreview,preview_dir
+from utils.translation_cache import TranslationCache,cache_key
+from utils.manifest import RunManifest,sha256_file,sha256_text
+from utils.profiler import Tracer,NO_TRACE
+from events import EventBus
+from constants.constants import SYSTEM_LATEX,SYSTEM_TOC,USER_MSG,TEXT_LAYER_MSG,HYBRID_MSG,BATCH_MSG,RETRY_REMINDER,REPAIR_REMINDER,REPAIR_MAX_ERRORS,COMPILE_LOG_TAIL_LINES,CONTENT_PAGE,cor,HEADING_PATTERNS,MAX_CONCURRENCY,PREFETCH_PAGES,BATCH_SIZE
 from utils.misc import printf
 from typing import List, Tuple
 
-def openai_logic(pdf_path:str, pages_arg:str, out_dir:str, language_selected:str, user_prompt:str ,api_key:str, model:str, title:str, content_page: bool):
+def build_page_parts(page:dict) -> List[dict]:
+    # Build content parts for this single page
+    if page["mode"] == "text":
+        return [{"type": "text", "text": TEXT_LAYER_MSG + "\n--- text layer ---\n" + page["text"]}]
+    if page["mode"] == "hybrid":
+        return [
+            {"type": "text", "text": HYBRID_MSG + "\n--- text layer ---\n" + page["text"]},
+            page["image"],
+        ]
+    return [
+        {"type": "text", "text": USER_MSG},  # your fixed user message
+        page["image"],                       # the page image
+    ]
+
+def request_bytes(parts:List[dict]) -> int:
+    return sum(len(part["text"]) if part["type"] == "text" else len(part["image_url"]["url"]) for part in parts)
+
+def call_model(parts:List[dict], pnos:List[int], api_key:str, model:str, system_msg:str, base_url:str = None, out_dir:str = None, stream:bool = False, tracer:Tracer = NO_TRACE, metrics:ClientMetrics = None) -> str:
+    with tracer.span("api", pages=pnos, request_bytes=request_bytes(parts)) as usage:
+        return stream_model(parts, pnos, api_key, model, system_msg, base_url, out_dir, stream, usage, metrics)
+
+def stream_model(parts:List[dict], pnos:List[int], api_key:str, model:str, system_msg:str, base_url:str, out_dir:str, stream:bool, usage:dict, metrics:ClientMetrics = None) -> str:
+    if not stream:
+        return openai_api(api_key=api_key, model=model, system_msg=system_msg, page=parts, base_url=base_url, usage=usage, metrics=metrics)
+    # Stream into a live preview; output that is clearly unusable is abandoned
+    # early and requested once more with a reminder, then accepted as is
+    preview = PagePreview(out_dir, pnos)
+    try:
+        reply = openai_api(api_key=api_key, model=model, system_msg=system_msg, page=parts, base_url=base_url, on_delta=preview, usage=usage, metrics=metrics, on_reset=preview.reset)
+    except BadOutputError as e:
+        printf(f"Abandoned pages {pnos} early ({e}), requesting them again")
+        preview = PagePreview(out_dir, pnos)
+        preview.check = False
+        preview.retried = str(e)
+        reply = openai_api(api_key=api_key, model=model, system_msg=system_msg + RETRY_REMINDER.format(reason=e),
+                           page=parts, base_url=base_url, on_delta=preview, usage=usage, metrics=metrics, on_reset=preview.reset)
+    preview.finish()
+    return reply
+
+def request_page(pno:int, page:dict, api_key:str, model:str, system_msg:str, base_url:str = None, out_dir:str = None, stream:bool = False, tracer:Tracer = NO_TRACE, metrics:ClientMetrics = None) -> str:
+    reply = call_model(build_page_parts(page), [pno], api_key, model, system_msg, base_url, out_dir, stream, tracer, metrics)
+    with tracer.span("sanitize", pages=[pno]):
+        return sanitize_for_xelatex(reply.strip())
+
+def request_batch(batch:List[Tuple[int, dict]], api_key:str, model:str, system_msg:str, base_url:str = None, out_dir:str = None, stream:bool = False, tracer:Tracer = NO_TRACE, metrics:ClientMetrics = None) -> dict:
+    """
+    Translate several pages in one request. Returns {page number: body}, or
+    None when the reply cannot be split back into exactly the requested pages.
+    """
+    pnos = [pno for pno, _ in batch]
+    parts = [{"type": "text", "text": BATCH_MSG.format(count=len(batch), pages=", ".join(map(str, pnos)))}]
+    for pno, page in batch:
+        header = f"--- PAGE {pno} ---"
+        if page["text"] is not None:
+            header += "\n--- text layer ---\n" + page["text"]
+        parts.append({"type": "text", "text": header})
+        if page["image"] is not None:
+            parts.append(page["image"])
+    reply = call_model(parts, pnos, api_key, model, system_msg, base_url, out_dir, stream, tracer, metrics)
+    found = re.findall(r"^%%% BEGIN PAGE (\d+) %%%[ \t]*\n(.*?)^%%% END PAGE \1 %%%", reply, flags=re.S|re.M)
+    if [int(n) for n, _ in found] != pnos:
+        printf(f"Could not split batch {pnos}, falling back to single pages")
+        return None
+    with tracer.span("sanitize", pages=pnos):
+        return {int(n): sanitize_for_xelatex(body.strip()) for n, body in found}
+
+def write_page(out_dir:str, pno:int, body:str) -> str:
+    page_body_path = os.path.join(out_dir, f"page_{pno:03d}.tex")
+    with open(page_body_path, "w", encoding="utf-8") as f:
+        f.write(body + "\n")
+    return page_body_path
+
+def translate_batch(batch:List[Tuple[int, dict]], out_dir:str, api_key:str, model:str, system_msg:str, cache:TranslationCache = None, base_url:str = None, stream:bool = False, tracer:Tracer = NO_TRACE, metrics:ClientMetrics = None) -> List[Tuple[int, str]]:
+    # Cached pages are written straight away; the rest share one request
+    results, todo = [], []
+    for pno, page in batch:
+        tracer.event("page_started", page=pno)
+        with tracer.span("cache_lookup", pages=[pno]) as span:
+            key = cache_key(model, system_msg, build_page_parts(page))
+            body = cache.get(key) if cache else None
+            span["cache_hits"] = int(body is not None)
+        if body is None:
+            todo.append((pno, page, key))
+        else:
+            results.append((pno, write_page(out_dir, pno, body)))
+    bodies = request_batch([(pno, page) for pno, page, _ in todo], api_key, model, system_msg, base_url, out_dir, stream, tracer, metrics) if len(todo) > 1 else None
+    for pno, page, key in todo:
+        body = bodies[pno] if bodies else request_page(pno, page, api_key, model, system_msg, base_url, out_dir, stream, tracer, metrics)
+        if cache:
+            cache.put(key, body)
+        # Save per-page body as soon as the page is done
+        results.append((pno, write_page(out_dir, pno, body)))
+    return results
+
+def write_encoding_report(out_dir:str, report:List[dict], skipped:dict = None):
+    total = sum(r["payload_bytes"] for r in report)
+    skipped = {pno: {"reason": reason, "ref": ref} for pno, (reason, ref) in sorted((skipped or {}).items())}
+    with open(os.path.join(out_dir, "encoding_report.json"), "w", encoding="utf-8") as f:
+        json.dump({"pages": report, "total_payload_bytes": total, "skipped": skipped}, f, indent=2)
+    modes = {m: sum(r["mode"] == m for r in report) for m in ("image", "hybrid", "text")}
+    printf(f"Sent {total / 1024:.1f} KiB of page content for {len(report)} pages ({modes})")
+    if skipped:
+        reasons = {r: sum(s["reason"] == r for s in skipped.values()) for r in ("blank", "duplicate", "build")}
+        printf(f"Skipped {len(skipped)} pages without a request ({reasons})")
+
+def openai_logic(pdf_path:str, pages_arg:str, out_dir:str, language_selected:str, user_prompt:str ,api_key:str, model:str, title:str, content_page: bool, max_workers: int = MAX_CONCURRENCY, adaptive_encoding: bool = True, text_layer: bool = True, batch_size: int = BATCH_SIZE, base_url: str = None, stream: bool = True, dedup_pages: bool = True, collapse_builds: bool = False, events: EventBus = None):
+    tracer = Tracer(events=events)
     try:
         doc = fitz.open(pdf_path)
         max_pages = len(doc)
         pages = parse_pages_arg(pages_arg, max_pages)
         if not pages:
-            printf(f"No valid pages selected in range 1..{max_pages}.", file=sys.stderr)
-            raise RuntimeError(f"No valid pages selected in range 1..{max_pages}.", file=sys.stderr)
-
-        # Page extraction logic:
-        page_extracted = extract_page(doc, pages)
-        set_total_page(len(page_extracted))
+            raise RuntimeError(f"No valid pages selected in range 1..{max_pages}.")
 
         out_dir = os.path.abspath(out_dir)
         os.makedirs(out_dir, exist_ok=True)
         parts_written = []
+        cache = TranslationCache()
+        metrics = ClientMetrics()
+        shutil.rmtree(preview_dir(out_dir), ignore_errors=True)
 
         cor_prompts = f"\nUser input contains math formula. Translate those into latex.\n \
                         IMPORTANT: Translate all the text into {language_selected} BEFORE GENERATING TEXT \n \
@@ -37,50 +149,153 @@ def openai_logic(pdf_path:str, pages_arg:str, out_dir:str, language_selected:str
 
         if content_page:
             user_prompt += CONTENT_PAGE
+        system_msg = SYSTEM_LATEX + user_prompt
 
-        # Send each page separately
-        for pno, img_part in page_extracted:
-            # Build content parts for this single page
-            page_parts = [
-                {"type": "text", "text": USER_MSG},  # your fixed user message
-                img_part,                            # the page image
-            ]
-            body = sanitize_for_xelatex(openai_api(
-                api_key=api_key,
-                model=model,
-                system_msg= SYSTEM_LATEX + user_prompt,
-                page = page_parts,
-            ).strip())
-            # Save per-page body
-            page_body_path = os.path.join(out_dir, f"page_{pno:03d}.tex")
-            with open(page_body_path, "w", encoding="utf-8") as f:
-                f.write(body + "\n")
-            parts_written.append((pno, page_body_path))
-            update_status()
-
-        # Assemble master.tex (unchanged)
+        # Resume: pages already translated under the same prompt and model are kept
+        manifest = RunManifest(out_dir, sha256_file(pdf_path))
+        manifest.select(pages)
+        prompt_sha256 = sha256_text(system_msg)
+        # What the model was shown of each page. batch_size only groups pages
+        # into requests and skipped pages are never resumed, so neither counts
+        encoding = f"adaptive_encoding={adaptive_encoding},text_layer={text_layer}"
+        # Blank and repeated pages, and with collapse_builds the early builds
+        # of a slide, need no request of their own
+        skipped = plan_pages(doc, pages, collapse_builds, tracer) if dedup_pages else {}
+        # Skipped pages are never resumed: blank and build pages are left out
+        # and duplicates are copied from their reference again, whatever an
+        # earlier run with other settings wrote for them
+        manifest.forget(list(skipped))
+        todo = []
+        for pno in pages:
+            if pno in skipped:
+                continue
+            done_path = manifest.completed(pno, prompt_sha256, model, encoding)
+            if done_path:
+                parts_written.append((pno, done_path))
+            else:
+                todo.append(pno)
+        if parts_written:
+            printf(f"Resuming: {len(parts_written)} of {len(pages)} pages already translated")
+        tracer.event("run_started", pages_total=len(pages), pages_resumed=[pno for pno, _ in parts_written])
+        copies = defaultdict(list)
+        for pno, (reason, ref) in skipped.items():
+            if reason == "duplicate":
+                copies[ref].append(pno)
+            else:
+                # Not part of this document, even if an earlier run translated it
+                if os.path.exists(os.path.join(out_dir, f"page_{pno:03d}.tex")):
+                    os.remove(os.path.join(out_dir, f"page_{pno:03d}.tex"))
+                tracer.event("page_skipped", page=pno, reason=reason, ref=ref)
+
+        def copy_page(pno:int, path:str):
+            # Repeats of a page get its LaTeX as soon as it is done
+            for dup in copies.pop(pno, ()):
+                dup_path = shutil.copyfile(path, os.path.join(out_dir, f"page_{dup:03d}.tex"))
+                manifest.record_page(dup, dup_path, prompt_sha256, model, encoding)
+                parts_written.append((dup, dup_path))
+                tracer.event("page_skipped", page=dup, reason="duplicate", ref=pno)
+        for pno, path in list(parts_written):
+            copy_page(pno, path)
+
+        # Pages are rasterized lazily while earlier pages are in flight
+        encoding_report = []
+        page_extracted = iter_pages(doc, todo, adaptive=adaptive_encoding, text_layer=text_layer, report=encoding_report, tracer=tracer)
+
+        # Send batches of batch_size pages concurrently, at most max_workers
+        # requests in flight and PREFETCH_PAGES more pages rendered and waiting,
+        # so memory stays bounded
+        max_workers = max(1, int(max_workers or 1))
+        batch_size = max(1, int(batch_size or 1))
+        window = max_workers + max(1, PREFETCH_PAGES // batch_size)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            def fill_window():
+                while len(futures) < window:
+                    batch = [item for _, item in zip(range(batch_size), page_extracted)]
+                    if not batch:
+                        return
+                    futures[pool.submit(translate_batch, batch, out_dir, api_key, model, system_msg, cache, base_url, stream, tracer, metrics)] = batch
+            try:
+                fill_window()
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        futures.pop(future)
+                        for pno, path in future.result():
+                            manifest.record_page(pno, path, prompt_sha256, model, encoding)
+                            parts_written.append((pno, path))
+                            tracer.event("page_finished", page=pno)
+                            copy_page(pno, path)
+                    fill_window()
+            except BaseException:
+                # Do not keep paying for pages once the job has failed
+                for future in futures:
+                    future.cancel()
+                raise
+        parts_written.sort()
+        write_encoding_report(out_dir, encoding_report, skipped)
+        printf(f"Translation cache: {cache.stats()['hits']} hits, {cache.stats()['misses']} misses")
+        usage = tracer.summary()["pages"].values()
+        prompt_tokens = sum(p.get("prompt_tokens", 0) for p in usage)
+        if prompt_tokens:
+            cached_tokens = sum(p.get("cached_tokens", 0) for p in usage)
+            printf(f"Prompt cache: {cached_tokens:.0f} of {prompt_tokens:.0f} prompt tokens cached ({100 * cached_tokens / prompt_tokens:.0f}%)")
+        printf(f"API requests of this job: {metrics.snapshot()}")
+
+        # Assemble master.tex in page order
         master_path = os.path.join(out_dir, "master.tex")
-        with open(master_path, "w", encoding="utf-8") as f:
-            f.write(make_master_preamble(title, language_selected, content_page))
-
-            for pno, body_path in parts_written:
-                with open(body_path, "r", encoding="utf-8") as b:
-                    content = b.read()
-                if not content.endswith("\n"):
-                    content += "\n"
-                f.write(content)
-            f.write(make_master_epilogue())
-        
+        def rebuild_master(quarantined=()):
+            write_master(master_path, title, language_selected, content_page, parts_written, quarantined)
+        with tracer.span("write_master"):
+            rebuild_master()
+
         printf(f"Wrote master LaTeX: {master_path}")
+
+        def render(pno:int) -> dict:
+            return next(iter_pages(doc, [pno], adaptive=adaptive_encoding, text_layer=text_layer, tracer=tracer))[1]
+
+        def retranslate(broken:dict):
+            # Pages that do not compile even after local fixes are requested
+            # again, each with the errors XeLaTeX gave for it
+            def repair(pno:int, page:dict):
+                errors = "\n".join(f"- {e}" for e in broken[pno][:REPAIR_MAX_ERRORS])
+                try:
+                    body = request_page(pno, page, api_key, model, system_msg + REPAIR_REMINDER.format(errors=errors), base_url, out_dir, False, tracer, metrics)
+                except Exception as e:
+                    # The page keeps its broken body and is quarantined
+                    printf(f"Could not translate page {pno} again: {e}")
+                    return
+                write_page(out_dir, pno, repair_body(body)[0])
+            pages = [(pno, render(pno)) for pno in broken]
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(lambda item: repair(*item), pages))
+
+        def page_changed(pno:int, path:str):
+            # Resume and the translation cache keep the version that compiles
+            manifest.record_page(pno, path, prompt_sha256, model, encoding)
+            with open(path, "r", encoding="utf-8") as f:
+                cache.put(cache_key(model, system_msg, build_page_parts(render(pno))), f.read().rstrip("\n"))
+
         printf("Compiling PDF...")
+        # Never leave the PDF of an earlier run next to a new master.tex
+        if os.path.exists(os.path.join(out_dir, "master.pdf")):
+            os.remove(os.path.join(out_dir, "master.pdf"))
         try:
-            compile_pdf(master_path, engine="xelatex",passes=5)
+            compile_document(master_path, parts_written, make_document_head(title, language_selected),
+                             make_master_epilogue(), rebuild_master, engine="xelatex", tracer=tracer,
+                             retranslate=retranslate, page_changed=page_changed)
             printf("PDF compiled successfully.")
-        except subprocess.CalledProcessError:
-            print("LaTeX compile failed.\n--- xelatex output ---\n")
+        except subprocess.CalledProcessError as e:
+            # Not caused by a page that could be quarantined: the job fails
+            # with the end of the log as its error
+            tail = "\n".join((e.output or "").splitlines()[-COMPILE_LOG_TAIL_LINES:])
+            raise RuntimeError(f"LaTeX compile failed.\n--- xelatex output ---\n{tail}") from e
     except Exception as e:
         raise e
     finally:
         doc.close()
+        # Written for failed runs too, next to master.tex
+        if os.path.isdir(out_dir):
+            tracer.write(out_dir)
 
 
@@ -0,0 +1,97 @@
+import re
+from typing import List, Tuple
+
+# Things a page body cannot contain: preamble commands, a second document,
+# files that do not exist next to master.tex
+FORBIDDEN = [
+    (r'^[ \t]*```[A-Za-z]*[ \t]*$\n?', "code fence"),
+    (r'\\documentclass(?:\[[^\]]*\])?\{[^}]*\}', "documentclass"),
+    (r'\\usepackage(?:\[[^\]]*\])?\{[^}]*\}', "usepackage"),
+    (r'\\begin\{document\}|\\end\{document\}', "document environment"),
+    (r'\\(?:input|include)\{[^}]*\}', "input"),
+]
+GRAPHICS = r'\\includegraphics(?:\[[^\]]*\])?\{[^}]*\}'
+# Environments whose content is not LaTeX
+VERBATIM = r'\\begin\{(verbatim|lstlisting|minted)\}.*?\\end\{\1\}'
+
+def mask(tex: str) -> str:
+    """
+    tex with comments, escaped characters (\\{, \\$, \\%) and verbatim blocks
+    blanked out, at the same positions, so braces, $ and environments can be
+    matched on it and edited in tex.
+    """
+    out = list(tex)
+    i = 0
+    while i < len(tex):
+        c = tex[i]
+        if c == "\\" and i + 1 < len(tex):
+            if not tex[i + 1].isalpha():
+                out[i + 1] = " "
+            i += 2
+        elif c == "%":
+            end = tex.find("\n", i)
+            end = len(tex) if end < 0 else end
+            out[i:end] = " " * (end - i)
+            i = end
+        else:
+            i += 1
+    masked = "".join(out)
+    for m in re.finditer(VERBATIM, masked, flags=re.S):
+        masked = masked[:m.start()] + " " * (m.end() - m.start()) + masked[m.end():]
+    return masked
+
+def apply_edits(tex: str, edits: List[Tuple[int, int, str]]) -> str:
+    # edits are (start, end, replacement) on tex; applied back to front
+    for start, end, text in sorted(edits, reverse=True):
+        tex = tex[:start] + text + tex[end:]
+    return tex
+
+def closer(opened: str) -> str:
+    return {"{": "}", "$": "$"}.get(opened) or f"\\end{{{opened}}}"
+
+def balance(tex: str) -> Tuple[str, int]:
+    """
+    Balance braces, environments and inline math in one pass, since they
+    nest inside each other: anything closing a group also closes what was
+    opened inside it, closers without an opener are dropped, and whatever
+    is still open is closed at the end, innermost first. Returns the body
+    and the number of edits.
+    """
+    masked = mask(tex)
+    stack, edits = [], []
+    for m in re.finditer(r'\\(begin|end)\{([^{}]+)\}|[{}$]', masked):
+        token = m.group(0)
+        if m.group(1) == "begin" or token == "{" or (token == "$" and stack[-1:] != ["$"]):
+            stack.append(m.group(2) or token)
+            continue
+        opened = m.group(2) or {"}": "{", "$": "$"}[token]
+        if opened not in stack:
+            edits.append((m.start(), m.end(), ""))
+            continue
+        closing = ""
+        while stack[-1] != opened:
+            closing += closer(stack.pop())
+        stack.pop()
+        if closing:
+            edits.append((m.start(), m.start(), closing))
+    tail = "".join(closer(opened) for opened in reversed(stack))
+    return apply_edits(tex, edits) + tail, len(edits) + len(stack)
+
+def repair_body(tex: str) -> Tuple[str, List[str]]:
+    """
+    Fast local fixes for a page body that does not compile: remove preamble
+    commands and missing files, then balance braces, environments and $.
+    Returns the body and the names of the fixes applied.
+    """
+    fixes = []
+    for pattern, name in FORBIDDEN:
+        tex, n = re.subn(pattern, "", tex, flags=re.M)
+        if n:
+            fixes.append(name)
+    tex, n = re.subn(GRAPHICS, r"\\fbox{figure}", tex)
+    if n:
+        fixes.append("includegraphics")
+    tex, n = balance(tex)
+    if n:
+        fixes.append("unbalanced groups")
+    return tex, fixes
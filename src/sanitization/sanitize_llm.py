@@ -9,6 +9,18 @@ def sanitize_for_xelatex(tex: str) -> str:
     tex = re.sub(r'\\usepackage(?:\[[^\]]*\])?\{CJK\*?u?t?f?8?\}', '', tex, flags=re.I)
     return tex
 
+def bad_output_reason(tex: str, start: bool = True):
+    # Output that is not worth finishing: sanitize_for_xelatex would strip it,
+    # or it is a whole document instead of a body. tex may be a window of a
+    # stream; start tells whether it begins at the start of the output
+    if re.search(r'\\begin\{CJK\*?\}', tex, flags=re.I):
+        return "CJK environment"
+    if re.search(r'\\documentclass|\\begin\{document\}', tex):
+        return "full document instead of a page body"
+    if start and tex.lstrip().startswith("```"):
+        return "markdown code fence"
+    return None
+
 def latex_escape(text: str) -> str:
     # Minimal escaping for common special chars in LaTeX titles
     repl = {
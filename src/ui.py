@@ -1,99 +1,88 @@
 # ui.py — Streamlit front-end for agent_latex.py
-import os
-import io
 import time
-import tempfile
-import pathlib
 import traceback
 import streamlit as st
-import zipfile
 from datetime import datetime
-from stqdm import stqdm
 from components.engine import engine
 from components.title import make_title
 from components.customize import customize
 from components.translation_setting import translation_setting
 from components.downloads import downloads
-# Import the pipeline function from your agent
-# (assumes agent_latex.py is in the same directory)
-from agent import run as agent_run
-from status import add_listener,clear_listeners
-from utils.payload_checker import payload_checker
+from components.live_preview import live_preview
+from components.trace_summary import trace_summary
+# Translations run as background jobs so they survive Streamlit reruns
+from jobs import get_queue
+from utils.job_spec import JobSpec
+from constants.constants import JOB_POLL_SECONDS
 
 
 
 if __name__ == "__main__":
 
     make_title()
-    globals().update(engine())
-    globals().update(customize(engine_choice))
-    globals().update(translation_setting())
+    engine_settings = engine()
+    custom_settings = customize(engine_settings["engine_choice"])
+    pdf_settings = translation_setting()
+    uploaded = pdf_settings["uploaded"]
     run_btn = st.button(
         "Generate", type="primary", use_container_width=True, disabled=(uploaded is None)
     )
 
     if run_btn:
-
-        st_bar = stqdm(total=100,desc="Operation in progress", bar_format="{l_bar}{bar} | {percentage:3.0f}% • {elapsed} < {remaining}")
-        clear_listeners()
-        def update_status_value(value):
-            st_bar.update(value)
-            if (st_bar.n == 100):
-                st_bar.set_description("Operation success")
-        add_listener(update_status_value)
-        os.system('rm -rf ./translated_output')
-
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                tmpdir_path = pathlib.Path(tmpdir)
-                # Save uploaded PDF to a temp file
-                pdf_path = tmpdir_path / uploaded.name
-                with open(pdf_path, "wb") as f:
-                    f.write(uploaded.read())
-                translation_time = datetime.now() 
-                # Prepare output directory under the current working dir
-                out_dir = pathlib.Path(f"translated_output/{translation_time}").absolute()
-                out_dir.mkdir(parents=True, exist_ok=True)
-
-               # Generate Payload
-                payload = {
-                    "engine_choice": engine_choice, 
-                    "pdf_path": str(pdf_path),
-                    "app_id": locals().get("app_id"),
-                    "base_url": base_url,
-                    "pages_arg": pages,
-                    "out_dir": str(out_dir),
-                    "title": title,
-                    "api_key": api_key.strip(),
-                    "user_prompt":user_prompt,
-                    "language_selected": locals().get("language_selected") or "",
-                    "content_page":content_page,
-                    "model": locals().get("model"),
-                    "uploaded":locals().get("uploaded"),
-                }
-                payload_checker(payload)
-
-                with st.status(
-                    "Processing… This can take a while for large PDFs.", state="running"
-                ) as status:
-                    st.write(
-                        f"**Engine:** `{engine_choice}` "
-                    )
-                    # Call the agent pipeline
-                    start = time.time()
-                    try:
-                        agent_run(payload)
-                        elapsed = time.time() - start
-                        status.update(label="Done!", state="complete")
-                        st.success(f"Completed in {elapsed:.1f}s")
-                    except Exception as e:
-                        st.error("Translation Failed. Error: ",e)
-
-            downloads(out_dir)                
-
+            if uploaded is None:
+                raise Exception("please upload a PDF First")
+            # Validated here, once; the job queue adds the input and output paths
+            spec = JobSpec(
+                **dict(engine_settings, api_key=engine_settings["api_key"].strip()),
+                **custom_settings,
+                pages_arg=pdf_settings["pages"],
+            )
+            # The job runs in the background and survives reruns of this script;
+            # its id in the URL brings it back after the page is reloaded
+            st.session_state["job_id"] = get_queue().submit(spec, uploaded.getvalue(), uploaded.name)
+            st.query_params["job"] = st.session_state["job_id"]
         except Exception as e:
             st.error("An error occurred.")
             st.exception(e)
             st.text(traceback.format_exc())
 
-
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+    job = get_queue().get(job_id) if job_id else None
+    if job:
+        started = datetime.fromisoformat(job["started"]) if job["started"] else None
+        if job["status"] in ("queued", "running"):
+            with st.status(
+                "Processing… This can take a while for large PDFs.", state="running"
+            ) as status:
+                st.write(
+                    f"**Engine:** `{job['settings']['engine_choice']}` "
+                )
+                if job["status"] == "queued":
+                    st.write("Waiting for a free worker…")
+                elif job["settings"]["engine_choice"] == "OpenAI (cloud)" and job["pages_total"]:
+                    progress = job.get("progress") or {}
+                    st.progress(min(progress.get("pages_done", 0) / job["pages_total"], 1.0),
+                                text=f"{progress.get('pages_done', 0)} / {job['pages_total']} pages translated")
+                    if progress.get("stage") == "compiling":
+                        st.write("Compiling PDF…")
+                    if progress.get("requests"):
+                        st.write(f"{progress['requests']} requests, {progress['prompt_tokens'] + progress['completion_tokens']} tokens "
+                                 f"({progress.get('cached_tokens', 0)} prompt tokens cached), "
+                                 f"{progress['retries']} retries, {progress['cache_hits']} pages from cache, "
+                                 f"{progress.get('pages_skipped', 0)} blank or repeated pages skipped")
+                if started:
+                    st.write(f"Elapsed: {(datetime.now() - started).total_seconds():.0f}s")
+                live_preview(job["out_dir"])
+            time.sleep(JOB_POLL_SECONDS)
+            st.rerun()
+        elif job["status"] == "done":
+            elapsed = (datetime.fromisoformat(job["finished"]) - started).total_seconds()
+            st.success(f"Completed in {elapsed:.1f}s")
+            with st.expander("Per-page streaming stats"):
+                live_preview(job["out_dir"], show_partial=False)
+            with st.expander("Timing report"):
+                trace_summary(job["out_dir"])
+            downloads(job["out_dir"], job["id"])
+        else:
+            st.error(f"Translation Failed. Error: {job['error']}")
@@ -1,21 +1,200 @@
-import os,subprocess
+import os,re,hashlib,subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 from utils.misc import printf
+from utils.latex_format import ensure_format
+from utils.profiler import Tracer,NO_TRACE
+from constants.constants import MAX_COMPILE_PASSES,RERUN_PATTERN,PAGE_MARKER_PATTERN
+from sanitization.latex_repair import repair_body
 # --- Config / Env ---
-def compile_pdf(tex_path: str, engine: str = "xelatex", passes: int = 2) -> None:
+def run_once(engine: str, tex_dir: str, fname: str, extra_args: List[str] = (), fmt: str = None) -> str:
+    env = None
+    if fmt:
+        # Look the precompiled preamble up first, then the default formats
+        extra_args = [f"-fmt={os.path.basename(fmt)}", *extra_args]
+        env = dict(os.environ, TEXFORMATS=os.path.dirname(fmt) + os.pathsep)
+    proc = subprocess.run(
+        [engine, "-interaction=nonstopmode", *extra_args, fname],
+        cwd=tex_dir,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="ignore",
+    )
+    printf(proc.stdout)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, output=proc.stdout)
+    return proc.stdout
+
+def aux_state(tex_path: str) -> str:
+    # Everything a later pass reads back: labels, ToC entries, hyperref outlines
+    h = hashlib.sha256()
+    stem = os.path.splitext(os.path.abspath(tex_path))[0]
+    for ext in (".aux", ".toc", ".out"):
+        try:
+            with open(stem + ext, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            h.update(b"missing")
+        h.update(ext.encode())
+    return h.hexdigest()
+
+def compile_until_stable(tex_path: str, engine: str = "xelatex", max_passes: int = MAX_COMPILE_PASSES, fmt: str = None, tracer: Tracer = NO_TRACE) -> int:
+    """
+    Run the engine until the .aux/.toc/.out files stop changing between
+    passes (and LaTeX no longer asks for a rerun). Returns the passes used.
+    """
     tex_dir = os.path.dirname(os.path.abspath(tex_path)) or "."
     fname = os.path.basename(tex_path)
-    def run_once():
-        proc = subprocess.run(
-            [engine, "-interaction=nonstopmode", fname],
-            cwd=tex_dir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-        )
-        printf(proc.stdout)
-        if proc.returncode != 0:
-            raise subprocess.CalledProcessError(proc.returncode, proc.args, output=proc.stdout)
-    for i in range(passes): 
-        run_once()
+    state = aux_state(tex_path)
+    for i in range(1, max_passes + 1):
+        with tracer.span("compile_pass", number=i):
+            output = run_once(engine, tex_dir, fname, fmt=fmt)
+        new_state = aux_state(tex_path)
+        if new_state == state and not re.search(RERUN_PATTERN, output):
+            return i
+        state = new_state
+    return max_passes
+
+def log_errors(output: str) -> List[Tuple[Optional[int], str]]:
+    """
+    The errors in an engine's output or log as (line number, message), where
+    the message includes the source line TeX showed. For an environment left
+    open the line is the one of its \\begin.
+    """
+    lines = output.splitlines()
+    errors = []
+    for i, line in enumerate(lines):
+        if not line.startswith("! "):
+            continue
+        message, lineno = line[2:].strip(), None
+        opened = re.search(r"on input line (\d+)", message)
+        for follow in lines[i + 1:i + 12]:
+            m = re.match(r"l\.(\d+) ?(.*)", follow)
+            if m:
+                lineno = int(m.group(1))
+                message += f" (at: {m.group(2).strip()})" if m.group(2).strip() else ""
+                break
+        errors.append((int(opened.group(1)) if opened else lineno, message))
+    return errors
+
+def pages_in_errors(master_path: str, errors: List[Tuple[Optional[int], str]]) -> Optional[List[int]]:
+    # Map error lines of master.tex to pages through the markers write_master
+    # leaves before each body; None if any error lies outside the page bodies
+    starts = []
+    with open(master_path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            m = re.match(PAGE_MARKER_PATTERN, line)
+            if m:
+                starts.append((lineno, int(m.group(1))))
+            elif line.startswith("\\end{document}"):
+                starts.append((lineno, None))
+    pages = set()
+    for lineno, _ in errors:
+        owner = None
+        for start, pno in starts:
+            if lineno is None or start > lineno:
+                break
+            owner = pno
+        if owner is None:
+            return None
+        pages.add(owner)
+    return sorted(pages)
+
+def check_page(pno: int, body_path: str, head: str, epilogue: str, check_dir: str, engine: str = "xelatex", fmt: str = None) -> Tuple[int, List[str]]:
+    # Compile one page body on its own, without producing a PDF; returns its errors
+    fname = f"check_page_{pno:03d}.tex"
+    with open(body_path, "r", encoding="utf-8") as b:
+        body = b.read()
+    with open(os.path.join(check_dir, fname), "w", encoding="utf-8") as f:
+        f.write(head + body + "\n" + epilogue)
+    try:
+        run_once(engine, check_dir, fname, ["-halt-on-error", "-no-pdf"], fmt=fmt)
+        return pno, []
+    except subprocess.CalledProcessError as e:
+        return pno, [message for _, message in log_errors(e.output or "")] or [f"{engine} exited with code {e.returncode}"]
+
+def find_broken_pages(parts: List[Tuple[int, str]], head: str, epilogue: str, check_dir: str, engine: str = "xelatex", max_workers: int = None, fmt: str = None) -> Dict[int, List[str]]:
+    """
+    Compile every page body independently; each check is its own engine
+    process, so the pool runs as many processes in parallel as workers.
+    Returns {page number: errors} of the pages that fail.
+    """
+    os.makedirs(check_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        results = pool.map(lambda part: check_page(part[0], part[1], head, epilogue, check_dir, engine, fmt), parts)
+        return {pno: errors for pno, errors in sorted(results) if errors}
+
+def repair_locally(path: str) -> List[str]:
+    # Rewrites the page body with repair_body; returns the fixes applied
+    with open(path, "r", encoding="utf-8") as f:
+        body = f.read()
+    body, fixes = repair_body(body)
+    if fixes:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(body if body.endswith("\n") else body + "\n")
+    return fixes
+
+def compile_document(master_path: str, parts: List[Tuple[int, str]], head: str, epilogue: str,
+                     rebuild_master: Callable[[List[int]], None], engine: str = "xelatex", tracer: Tracer = NO_TRACE,
+                     retranslate: Callable[[Dict[int, List[str]]], None] = None,
+                     page_changed: Callable[[int, str], None] = None) -> List[int]:
+    """
+    Compile master.tex with the fewest passes needed. If it fails, the pages
+    its errors point to are checked on their own (every page if that finds
+    none). Failing pages are first repaired locally, then handed with their
+    errors to retranslate, if given, which rewrites their bodies; each time
+    only the changed pages are checked again. Pages that still fail are
+    quarantined by rebuild_master and the document is compiled once more.
+    page_changed is called for every body that was repaired. Returns the
+    quarantined page numbers.
+    """
+    with tracer.span("preamble_format"):
+        fmt = ensure_format(head, engine)
+    try:
+        passes = compile_until_stable(master_path, engine, fmt=fmt, tracer=tracer)
+        printf(f"PDF compiled in {passes} pass(es).")
+        return []
+    except subprocess.CalledProcessError as e:
+        failure = e
+    check_dir = os.path.join(os.path.dirname(os.path.abspath(master_path)), "page_checks")
+    paths = dict(parts)
+    check = lambda pnos: find_broken_pages([(pno, paths[pno]) for pno in pnos], head, epilogue, check_dir, engine, fmt=fmt)
+    suspects = pages_in_errors(master_path, log_errors(failure.output or ""))
+    with tracer.span("page_checks", pages=suspects or list(paths)):
+        broken = check(suspects) if suspects else {}
+        if not broken:
+            # The error surfaced away from its cause, e.g. at \end{document}
+            # after a group left open, so every page is checked
+            broken = check(list(paths))
+    if not broken:
+        raise failure
+    printf(f"Pages that do not compile: {sorted(broken)}")
+
+    def repaired(pnos: List[int], how: str):
+        for pno in pnos:
+            tracer.event("page_repaired", page=pno, how=how)
+            if page_changed:
+                page_changed(pno, paths[pno])
+        if pnos:
+            printf(f"Repaired pages {pnos} ({how})")
 
+    with tracer.span("repair_local", pages=sorted(broken)):
+        changed = [pno for pno in sorted(broken) if repair_locally(paths[pno])]
+        still = check(changed)
+    repaired([pno for pno in changed if pno not in still], "local")
+    broken = {pno: still.get(pno, errors) for pno, errors in broken.items() if pno not in changed or pno in still}
+    if broken and retranslate:
+        with tracer.span("repair_translate", pages=sorted(broken)):
+            retranslate(broken)
+            still = check(sorted(broken))
+        repaired([pno for pno in sorted(broken) if pno not in still], "translate")
+        broken = still
 
+    if broken:
+        printf(f"Quarantined pages that do not compile: {sorted(broken)}")
+    rebuild_master(sorted(broken))
+    passes = compile_until_stable(master_path, engine, fmt=fmt, tracer=tracer)
+    printf(f"PDF compiled in {passes} pass(es).")
+    return sorted(broken)
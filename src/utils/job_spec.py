@@ -0,0 +1,62 @@
+from dataclasses import dataclass,field,asdict,replace
+from typing import Optional
+from constants.constants import MAX_CONCURRENCY,MAX_CONCURRENCY_LIMIT,BATCH_SIZE,BATCH_SIZE_LIMIT,MATHPIX_CHUNK_LIMIT,cor
+
+ENGINES = ("OpenAI (cloud)", "Mathpix (cloud)", "Custom")
+# Never written to job records or summaries
+SECRET_FIELDS = ("api_key", "app_id")
+
+@dataclass(frozen=True)
+class JobSpec:
+    """
+    Everything one translation needs, checked once when it is created and
+    passed explicitly from the UI or CLI through the job queue to the engine.
+    pdf_path and out_dir are filled in by whoever stores the input (see
+    with_paths); the rest never changes for the lifetime of a job.
+    """
+    engine_choice: str
+    base_url: str
+    pages_arg: str
+    api_key: str = field(default="", repr=False)
+    app_id: Optional[str] = field(default=None, repr=False)
+    model: str = ""
+    title: str = "Translated Document"
+    user_prompt: str = ""
+    language_selected: str = ""
+    content_page: bool = False
+    max_workers: int = MAX_CONCURRENCY
+    adaptive_encoding: bool = True
+    text_layer: bool = True
+    batch_size: int = BATCH_SIZE
+    stream: bool = True
+    dedup_pages: bool = True
+    collapse_builds: bool = False
+    chunk_size: int = 0
+    pdf_path: Optional[str] = None
+    out_dir: Optional[str] = None
+
+    def __post_init__(self):
+        if self.engine_choice not in ENGINES:
+            raise ValueError(f"Unknown engine {self.engine_choice!r}")
+        if not self.base_url:
+            raise ValueError("base_url cannot be empty")
+        if self.engine_choice == "OpenAI (cloud)" and not self.api_key:
+            raise ValueError("Please provide an OpenAI API key")
+        if self.engine_choice == "Mathpix (cloud)" and (not self.api_key or not self.app_id):
+            raise ValueError("Please provide Mathpix API key and APP id")
+        if not self.pages_arg:
+            raise ValueError("Please enter a page number")
+        if self.language_selected not in cor:
+            raise ValueError(f"Translating into {self.language_selected!r} is not supported")
+        if not 1 <= self.max_workers <= MAX_CONCURRENCY_LIMIT:
+            raise ValueError(f"max_workers must be between 1 and {MAX_CONCURRENCY_LIMIT}")
+        if not 1 <= self.batch_size <= BATCH_SIZE_LIMIT:
+            raise ValueError(f"batch_size must be between 1 and {BATCH_SIZE_LIMIT}")
+        if not 0 <= self.chunk_size <= MATHPIX_CHUNK_LIMIT:
+            raise ValueError(f"chunk_size must be between 0 and {MATHPIX_CHUNK_LIMIT}")
+
+    def with_paths(self, pdf_path: str, out_dir: str) -> "JobSpec":
+        return replace(self, pdf_path=pdf_path, out_dir=out_dir)
+
+    def settings(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if k not in SECRET_FIELDS}
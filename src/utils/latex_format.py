@@ -0,0 +1,75 @@
+import os,time,hashlib,threading,subprocess
+from functools import lru_cache
+from typing import Optional
+from utils.misc import printf
+from constants.constants import FORMAT_CACHE_DIR,FORMAT_RETRY_SECONDS,ENDOFDUMP
+
+_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def engine_version(engine: str) -> str:
+    try:
+        return subprocess.run([engine, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True, errors="ignore").stdout.split("\n", 1)[0]
+    except OSError:
+        return ""
+
+def format_name(head: str, engine: str = "xelatex") -> Optional[str]:
+    # Only the part before \endofdump goes into the format
+    if ENDOFDUMP not in head:
+        return None
+    dumped = head.split(ENDOFDUMP, 1)[0]
+    digest = hashlib.sha256((engine_version(engine) + "\0" + dumped).encode("utf-8")).hexdigest()
+    return f"preamble_{digest[:16]}"
+
+def ensure_format(head: str, engine: str = "xelatex") -> Optional[str]:
+    """
+    Build (once) and return the path of a mylatexformat dump of the
+    preamble, without the extension, or None if it cannot be built. The
+    format is keyed by the preamble text and engine version, so any change
+    to either builds a new one. A failed build is tried again after
+    FORMAT_RETRY_SECONDS, e.g. once mylatexformat has been installed.
+
+    Only the part before ENDOFDUMP (the class, geometry, the AMS packages
+    and tikz) is dumped; XeTeX cannot dump native fonts, so fontspec, xeCJK
+    and the font setup are loaded on every pass. Without a format, because
+    the engine or mylatexformat is missing or the dump fails, documents
+    compile from the full preamble.
+    """
+    name = format_name(head, engine)
+    if name is None:
+        return None
+    cache_dir = os.path.abspath(FORMAT_CACHE_DIR)
+    fmt_path = os.path.join(cache_dir, name)
+    with _lock:
+        if os.path.exists(fmt_path + ".fmt"):
+            return fmt_path
+        failed = fmt_path + ".failed"
+        if os.path.exists(failed) and time.time() - os.path.getmtime(failed) < FORMAT_RETRY_SECONDS:
+            return None
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(fmt_path + ".tex", "w", encoding="utf-8") as f:
+            f.write(head.split(ENDOFDUMP, 1)[0] + ENDOFDUMP + "\n\\begin{document}\n\\end{document}\n")
+        try:
+            proc = subprocess.run(
+                [engine, "-ini", "-interaction=nonstopmode", f"-jobname={name}", f"&{engine}", "mylatexformat.ltx", f"{name}.tex"],
+                cwd=cache_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="ignore",
+            )
+            built, output = proc.returncode == 0 and os.path.exists(fmt_path + ".fmt"), proc.stdout
+        except OSError as e:
+            # The engine itself is missing; the compile without a format reports it
+            built, output = False, str(e)
+        if not built:
+            printf(f"Could not build preamble format, compiling without it.\n{output}")
+            # Remember the failure for a while so every compile does not retry it
+            with open(failed, "w", encoding="utf-8") as f:
+                f.write(engine_version(engine) + "\n")
+            return None
+        if os.path.exists(failed):
+            os.remove(failed)
+        printf(f"Built preamble format {fmt_path}.fmt")
+        return fmt_path
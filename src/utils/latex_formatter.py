@@ -1,16 +1,21 @@
+import os
 from sanitization.sanitize_llm import latex_escape
-from constants.constants import cor
-def make_master_preamble(title: str = "Translated Document", language: str = "English", ToC: bool = False) -> str:
+from constants.constants import cor,ENDOFDUMP,PAGE_MARKER
+from typing import List, Tuple
+def make_document_head(title: str = "Translated Document", language: str = "English") -> str:
     t = latex_escape(title)
+    # Packages before ENDOFDUMP are precompiled into a format; XeTeX cannot
+    # dump native fonts, so fontspec/xeCJK and everything after stay outside
     return r"""\documentclass[11pt]{article}
 \usepackage[margin=1in]{geometry}
+\usepackage{amsmath,amssymb,mathtools}
+\usepackage{tikz}
+""" + ENDOFDUMP + r"""
 \usepackage{fontspec}
 \usepackage{xeCJK}
 \usepackage[english,spanish,es-noshorthands]{babel}
 \usepackage{newunicodechar}
-\usepackage{amsmath,amssymb,mathtools}
 \newunicodechar{−}{\ensuremath{-}}
-\usepackage{tikz}
 \usepackage[hidelinks]{hyperref} % for clickable ToC links
 """ + f"\\setCJKmainfont{{{cor[language]}}}\n" + r"""\defaultfontfeatures{Ligatures=TeX}
 \setmainfont{Liberation Serif}
@@ -22,7 +27,10 @@ def make_master_preamble(title: str = "Translated Document", language: str = "En
 \title{""" + t + r"""}
 \date{}
 \begin{document}
-\maketitle
+"""
+
+def make_master_preamble(title: str = "Translated Document", language: str = "English", ToC: bool = False) -> str:
+    return make_document_head(title, language) + r"""\maketitle
 \setcounter{tocdepth}{2}
 """ + (r"""
 \tableofcontents
@@ -32,3 +40,26 @@ def make_master_preamble(title: str = "Translated Document", language: str = "En
 def make_master_epilogue() -> str:
     return r"""\end{document}
 """
+
+def make_quarantine_note(pno: int) -> str:
+    return (f"% page_{pno:03d}.tex did not compile on its own and was left out\n"
+            f"\\begin{{center}}\\fbox{{Page {pno} could not be compiled, see page\\_{pno:03d}.tex}}\\end{{center}}\n")
+
+def write_master(master_path: str, title: str, language: str, ToC: bool, parts: List[Tuple[int, str]], quarantined: List[int] = ()):
+    # Replaced, never rewritten in place: published jobs hard-link master.tex
+    tmp = master_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(make_master_preamble(title, language, ToC))
+
+        for pno, body_path in parts:
+            f.write(PAGE_MARKER.format(pno=pno))
+            if pno in quarantined:
+                f.write(make_quarantine_note(pno))
+                continue
+            with open(body_path, "r", encoding="utf-8") as b:
+                content = b.read()
+            if not content.endswith("\n"):
+                content += "\n"
+            f.write(content)
+        f.write(make_master_epilogue())
+    os.replace(tmp, master_path)
@@ -0,0 +1,75 @@
+import os,json,hashlib,threading
+from typing import List, Optional
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class RunManifest:
+    """
+    Checkpoint of a translation run, kept as manifest.json in the output
+    directory. Each finished page is recorded with the prompt, model and
+    page encoding it was translated with and the hash of its page_NNN.tex,
+    so a later run of the same document can skip every page that is still
+    valid. The encoding is whatever the caller says decides what the model
+    saw of a page; settings that only group pages into requests are not part
+    of it.
+    """
+    def __init__(self, out_dir: str, pdf_sha256: str):
+        self.path = os.path.join(out_dir, "manifest.json")
+        self._lock = threading.Lock()
+        self.data = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if not self.data or self.data.get("pdf_sha256") != pdf_sha256:
+            self.data = {"pdf_sha256": pdf_sha256, "selected": [], "pages": {}}
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def select(self, pages: List[int]):
+        with self._lock:
+            self.data["selected"] = list(pages)
+            self._save()
+
+    def completed(self, pno: int, prompt_sha256: str, model: str, encoding: str = "") -> Optional[str]:
+        # A page counts only if its file is still exactly what was recorded
+        entry = self.data["pages"].get(str(pno))
+        if not entry or entry["prompt_sha256"] != prompt_sha256 or entry["model"] != model or entry.get("encoding", "") != encoding:
+            return None
+        path = os.path.join(os.path.dirname(self.path), entry["file"])
+        if not os.path.exists(path) or sha256_file(path) != entry["sha256"]:
+            return None
+        return path
+
+    def forget(self, pnos: List[int]):
+        with self._lock:
+            for pno in pnos:
+                self.data["pages"].pop(str(pno), None)
+            self._save()
+
+    def record_page(self, pno: int, path: str, prompt_sha256: str, model: str, encoding: str = ""):
+        entry = {"file": os.path.basename(path), "sha256": sha256_file(path), "prompt_sha256": prompt_sha256, "model": model,
+                 "encoding": encoding}
+        with self._lock:
+            self.data["pages"][str(pno)] = entry
+            self._save()
+
+def selected_pages(out_dir: str) -> Optional[List[int]]:
+    try:
+        with open(os.path.join(out_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["selected"]
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,54 @@
+import os,re,zipfile
+import pymupdf as fitz
+from typing import List
+
+def merge_pdfs(pdf_paths: List[str], dest: str):
+    merged = fitz.open()
+    for path in pdf_paths:
+        with fitz.open(path) as part:
+            merged.insert_pdf(part)
+    merged.save(dest + ".tmp")
+    merged.close()
+    os.replace(dest + ".tmp", dest)
+
+def split_document(tex: str):
+    # (preamble, body) around \begin{document} ... \end{document}
+    begin = tex.find("\\begin{document}")
+    end = tex.rfind("\\end{document}")
+    if begin < 0:
+        return "", tex
+    return tex[:begin], tex[begin + len("\\begin{document}"):end if end > begin else len(tex)]
+
+def merge_tex_zips(zip_paths: List[str], dest: str):
+    """
+    Stitch the tex.zip of every chunk into one project: the first chunk's
+    preamble plus any package the other chunks added, the bodies in chunk
+    order, and all images in one folder (the first file wins on a name clash).
+    """
+    preamble, bodies, extra_packages, files = None, [], [], {}
+    for path in zip_paths:
+        with zipfile.ZipFile(path) as z:
+            for info in z.infolist():
+                if info.is_dir():
+                    continue
+                # Mathpix puts everything under a <pdf_id>/ folder
+                rel = info.filename.split("/", 1)[1] if "/" in info.filename else info.filename
+                if rel.endswith(".tex") and "/" not in rel:
+                    head, body = split_document(z.read(info).decode("utf-8", errors="ignore"))
+                    if preamble is None:
+                        preamble = head
+                    else:
+                        extra_packages += [line for line in re.findall(r"^\\usepackage.*$", head, flags=re.M)
+                                           if line not in preamble and line not in extra_packages]
+                    bodies.append(body.strip("\n"))
+                elif rel not in files:
+                    files[rel] = z.read(info)
+    if preamble is None:
+        raise Exception("Mathpix tex.zip did not contain a .tex file")
+    tex = preamble.rstrip("\n") + "\n" + "".join(line + "\n" for line in extra_packages)
+    tex += "\\begin{document}\n" + "\n\n".join(bodies) + "\n\\end{document}\n"
+    with zipfile.ZipFile(dest + ".tmp", "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("master/master.tex", tex)
+        for rel, data in files.items():
+            z.writestr("master/" + rel, data)
+    os.replace(dest + ".tmp", dest)
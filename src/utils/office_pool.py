@@ -0,0 +1,142 @@
+import os,time,queue,atexit,shutil,signal,socket,threading,subprocess
+from concurrent.futures import Future
+from typing import Dict
+from constants.constants import OFFICE_BINARY,OFFICE_WORKERS,OFFICE_PROFILE_DIR,OFFICE_TIMEOUT_SECONDS,OFFICE_START_SECONDS,OFFICE_BASE_PORT
+from utils.misc import printf
+
+class OfficePool:
+    """
+    Headless LibreOffice converters. Each worker keeps one instance running
+    on its own user profile, listening on port base + index, so parallel
+    conversions never share (and lock) a profile. A conversion started on
+    that profile is handed to the running instance and exits once the PDF
+    is written, instead of starting and initialising LibreOffice again.
+    Between jobs a worker checks that its instance is still up and accepts
+    connections, and restarts it if not.
+    """
+    def __init__(self, workers: int = OFFICE_WORKERS, profile_dir: str = OFFICE_PROFILE_DIR,
+                 timeout: float = OFFICE_TIMEOUT_SECONDS, binary: str = OFFICE_BINARY,
+                 base_port: int = OFFICE_BASE_PORT):
+        self.binary = shutil.which(binary) or binary
+        self.profile_dir = os.path.abspath(profile_dir)
+        self.timeout = timeout
+        self.base_port = base_port
+        self._servers: Dict[int, subprocess.Popen] = {}
+        self._jobs = queue.Queue()
+        atexit.register(self.close)
+        for index in range(workers):
+            threading.Thread(target=self._worker, args=(index,), name=f"office-{index}", daemon=True).start()
+
+    def _profile(self, index: int) -> str:
+        return os.path.join(self.profile_dir, f"worker_{index}")
+
+    def _command(self, index: int, *args) -> list:
+        return [self.binary, f"-env:UserInstallation=file://{self._profile(index)}",
+                "--headless", "--norestore", "--nologo", *args]
+
+    def _listening(self, index: int) -> bool:
+        try:
+            socket.create_connection(("127.0.0.1", self.base_port + index), timeout=1).close()
+            return True
+        except OSError:
+            return False
+
+    def _healthy(self, index: int) -> bool:
+        server = self._servers.get(index)
+        return server is not None and server.poll() is None and self._listening(index)
+
+    def _start(self, index: int):
+        # Own process group, so a hung instance and its children can be killed together
+        server = subprocess.Popen(
+            self._command(index, "--invisible", "--nodefault",
+                          f"--accept=socket,host=127.0.0.1,port={self.base_port + index};urp;"),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self._servers[index] = server
+        deadline = time.monotonic() + OFFICE_START_SECONDS
+        while not self._listening(index):
+            if server.poll() is not None or time.monotonic() > deadline:
+                self._stop(index)
+                raise Exception(f"LibreOffice worker {index} did not start")
+            time.sleep(0.2)
+
+    def _stop(self, index: int):
+        server = self._servers.pop(index, None)
+        if server is not None and server.poll() is None:
+            os.killpg(server.pid, signal.SIGKILL)
+            server.wait()
+
+    def _reset(self, index: int):
+        # A crash can leave the profile locked or corrupt; start over with a fresh one
+        self._stop(index)
+        shutil.rmtree(self._profile(index), ignore_errors=True)
+        self._start(index)
+
+    def _convert(self, index: int, src: str, out_dir: str) -> str:
+        dest = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + ".pdf")
+        if os.path.exists(dest):
+            os.remove(dest)
+        proc = subprocess.Popen(
+            self._command(index, "--convert-to", "pdf", "--outdir", out_dir, src),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="ignore",
+            start_new_session=True,
+        )
+        try:
+            out, _ = proc.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.communicate()
+            raise Exception(f"LibreOffice did not finish within {self.timeout:.0f}s")
+        if proc.returncode != 0 or not os.path.exists(dest) or os.path.getsize(dest) == 0:
+            raise Exception(f"LibreOffice could not convert {src}: {out.strip()}")
+        return dest
+
+    def _worker(self, index: int):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        while True:
+            src, out_dir, future = self._jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if not self._healthy(index):
+                    self._stop(index)
+                    self._start(index)
+                try:
+                    dest = self._convert(index, src, out_dir)
+                except Exception as e:
+                    printf(f"LibreOffice worker {index} failed, retrying on a fresh profile: {e}")
+                    self._reset(index)
+                    dest = self._convert(index, src, out_dir)
+                future.set_result(dest)
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, src: str, out_dir: str) -> Future:
+        future = Future()
+        self._jobs.put((os.path.abspath(src), os.path.abspath(out_dir), future))
+        return future
+
+    def convert(self, src: str, out_dir: str) -> str:
+        # Blocks until a worker has written <out_dir>/<name>.pdf and returns its path
+        return self.submit(src, out_dir).result()
+
+    def close(self):
+        # Stop the running instances; workers start them again on their next job
+        for index in list(self._servers):
+            self._stop(index)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> OfficePool:
+    # One pool per process, shared by every job
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OfficePool()
+        return _pool
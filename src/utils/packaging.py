@@ -0,0 +1,81 @@
+import os,re,shutil,zipfile
+from typing import Dict, List
+from utils.manifest import selected_pages
+from constants.constants import STATIC_DIR,STATIC_URL
+
+# Already compressed; deflating them again only costs CPU
+STORED_SUFFIXES = (".pdf", ".docx", ".zip", ".png", ".jpg", ".jpeg")
+DOWNLOADS = ("master.zip", "master.tex", "master.pdf", "master.docx", "master.tex.zip")
+
+def archive_members(out_dir: str) -> List[str]:
+    # The output directory is shared by reruns of a document; ship only this selection
+    selected = selected_pages(out_dir)
+    names = sorted(os.listdir(out_dir))
+    pages = [n for n in names if re.fullmatch(r"page_\d+\.tex", n) and (selected is None or int(n[5:-4]) in selected)]
+    parts = [n for n in names if re.fullmatch(r"master_part_\d+\.docx", n)]
+    members = ["master.tex", "master.pdf", *pages, "master.docx", *parts, "master.tex.zip"]
+    return [n for n in members if os.path.isfile(os.path.join(out_dir, n))]
+
+def build_archive(out_dir: str, name: str = "master.zip") -> str:
+    """
+    Write out_dir/name with every output of the run. Files are copied into
+    the archive in chunks, compressed formats are stored as they are.
+    """
+    dest = os.path.join(out_dir, name)
+    tmp = dest + ".tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as z:
+        for member in archive_members(out_dir):
+            compress = zipfile.ZIP_STORED if member.endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+            z.write(os.path.join(out_dir, member), arcname=member, compress_type=compress)
+    os.replace(tmp, dest)
+    return dest
+
+def publish_dir(job_id: str) -> str:
+    return os.path.join(STATIC_DIR, "jobs", job_id)
+
+def detach_outputs(out_dir: str):
+    """
+    Unlink the downloads of an earlier run from out_dir before a new run
+    starts. Tools like xelatex and soffice rewrite their output files in
+    place, which would change the file behind a published hard link; after
+    this they always create new files.
+    """
+    for name in DOWNLOADS:
+        try:
+            os.remove(os.path.join(out_dir, name))
+        except FileNotFoundError:
+            pass
+
+def publish(job_id: str, out_dir: str):
+    """
+    Hard-link the downloads of a finished job into the static directory.
+    The links keep this job's files when a rerun of the same document writes
+    new ones into the shared output directory: every run starts with
+    detach_outputs, and the files written here directly (master.tex,
+    archives, Mathpix artifacts) are replaced, never rewritten in place.
+    If the filesystem cannot link, the files are copied.
+    """
+    target = publish_dir(job_id)
+    os.makedirs(target, exist_ok=True)
+    for name in DOWNLOADS:
+        src = os.path.join(out_dir, name)
+        if not os.path.isfile(src):
+            continue
+        dest = os.path.join(target, name)
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+
+def published(job_id: str) -> Dict[str, str]:
+    # {file name: path on disk} of a published job, in DOWNLOADS order
+    target = publish_dir(job_id)
+    return {name: os.path.join(target, name) for name in DOWNLOADS if os.path.isfile(os.path.join(target, name))}
+
+def published_url(job_id: str, name: str) -> str:
+    return f"{STATIC_URL}/jobs/{job_id}/{name}"
+
+def unpublish(job_id: str):
+    shutil.rmtree(publish_dir(job_id), ignore_errors=True)
@@ -0,0 +1,118 @@
+import pymupdf as fitz
+import re,hashlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from constants.constants import DEDUP_HASH_SIZE,DEDUP_MAX_DISTANCE,BUILD_MAX_DISTANCE,BLANK_INK_RATIO
+from utils.profiler import Tracer,NO_TRACE
+
+# Page numbers and slide counters ("12", "3 / 20") differ between otherwise identical pages
+COUNTER_LINE = r"[\d\s/|.\-–]+"
+
+def _grid(samples: bytes, width: int, height: int, stride: int, cols: int, rows: int) -> List[float]:
+    # Mean grey value of each cell of a cols x rows grid over the thumbnail
+    cells = []
+    for r in range(rows):
+        y0, y1 = r * height // rows, max(r * height // rows + 1, (r + 1) * height // rows)
+        for c in range(cols):
+            x0, x1 = c * width // cols, max(c * width // cols + 1, (c + 1) * width // cols)
+            total = sum(samples[y * stride + x] for y in range(y0, y1) for x in range(x0, x1))
+            cells.append(total / ((y1 - y0) * (x1 - x0)))
+    return cells
+
+def page_fingerprint(p: fitz.Page) -> dict:
+    """
+    Cheap identity of a page: its text lines without counters, a difference
+    hash (dHash) of a grey thumbnail, a digest of the thumbnail itself and
+    the share of dark pixels on it.
+    """
+    lines = [" ".join(line.split()) for line in p.get_text("text").splitlines()]
+    lines = [line for line in lines if line and not re.fullmatch(COUNTER_LINE, line)]
+    scale = 64 / float(p.rect.width or 64)
+    thumb = p.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY, alpha=False)
+    samples = thumb.samples
+    pixels = [samples[y * thumb.stride + x] for y in range(thumb.height) for x in range(thumb.width)]
+    cells = _grid(samples, thumb.width, thumb.height, thumb.stride, DEDUP_HASH_SIZE + 1, DEDUP_HASH_SIZE)
+    dhash = 0
+    for r in range(DEDUP_HASH_SIZE):
+        row = cells[r * (DEDUP_HASH_SIZE + 1):(r + 1) * (DEDUP_HASH_SIZE + 1)]
+        for left, right in zip(row, row[1:]):
+            dhash = (dhash << 1) | (left > right)
+    return {
+        "lines": lines,
+        "dhash": dhash,
+        "size": (round(p.rect.width), round(p.rect.height)),
+        "digest": hashlib.sha256(bytes(pixels)).hexdigest(),
+        "ink": sum(v < 224 for v in pixels) / max(1, len(pixels)),
+    }
+
+def distance(a: dict, b: dict) -> Optional[int]:
+    # Differing dHash bits; None for pages of different size
+    if a["size"] != b["size"]:
+        return None
+    return bin(a["dhash"] ^ b["dhash"]).count("1")
+
+def is_blank(fp: dict) -> bool:
+    return not fp["lines"] and fp["ink"] < BLANK_INK_RATIO
+
+def is_duplicate(fp: dict, first: dict) -> bool:
+    # Same text and nearly the same picture; pages without text must render identically
+    if fp["lines"] != first["lines"]:
+        return False
+    if not fp["lines"]:
+        return fp["digest"] == first["digest"]
+    d = distance(fp, first)
+    return d is not None and d <= DEDUP_MAX_DISTANCE
+
+def is_build(fp: dict, final: dict) -> bool:
+    """
+    Whether fp is an incremental build of final: the same slide with fewer
+    lines revealed. Same title, every line of fp in final in the same order,
+    and a picture that changed only a little.
+    """
+    lines, later = fp["lines"], final["lines"]
+    if not lines or len(lines) >= len(later) or lines[0] != later[0]:
+        return False
+    rest = iter(later)
+    if not all(line in rest for line in lines):
+        return False
+    d = distance(fp, final)
+    return d is not None and d <= BUILD_MAX_DISTANCE
+
+def plan_pages(doc: fitz.Document, pages: List[int], collapse_builds: bool = False, tracer: Tracer = NO_TRACE) -> Dict[int, Tuple[str, Optional[int]]]:
+    """
+    Find the selected pages that need no request of their own, as
+    {page number: (reason, reference page)}:
+    "blank" pages are left out of the document (reference None),
+    "duplicate" pages reuse the LaTeX of the earlier reference page, and with
+    collapse_builds, "build" pages are left out because the reference, a
+    later page, shows the same slide complete.
+    """
+    with tracer.span("dedup") as span:
+        fps = {pno: page_fingerprint(doc[pno - 1]) for pno in pages}
+        plan = {}
+        firsts = []
+        by_text = defaultdict(list)   # first occurrences by their text lines
+        for pno in pages:
+            fp = fps[pno]
+            if is_blank(fp):
+                plan[pno] = ("blank", None)
+                continue
+            key = tuple(fp["lines"])
+            first = next((f for f in by_text[key] if is_duplicate(fp, fps[f])), None)
+            if first is None:
+                firsts.append(pno)
+                by_text[key].append(pno)
+            else:
+                plan[pno] = ("duplicate", first)
+        if collapse_builds:
+            # Pages other pages are copied from are always translated
+            refs = {ref for reason, ref in plan.values() if reason == "duplicate"}
+            final = None
+            for pno in reversed(firsts):
+                if final is not None and pno + 1 in fps and plan.get(pno + 1, ("build",))[0] == "build" \
+                        and pno not in refs and is_build(fps[pno], fps[pno + 1]):
+                    plan[pno] = ("build", final)
+                else:
+                    final = pno
+        span["pages_skipped"] = len(plan)
+    return plan
@@ -1,6 +1,9 @@
 import pymupdf as fitz 
-import argparse,base64
+import argparse,base64,re
+from collections import Counter
 from typing import List, Tuple
+from constants.constants import ENCODING_PROFILES,SPARSE_TEXT_CHARS,COLOR_PIXEL_RATIO,MATH_FONT_PATTERN,MATH_CHAR_PATTERN
+from utils.profiler import Tracer,NO_TRACE
 # --- Utilities ---
 def parse_pages_arg(pages_arg: str, max_pages: int) -> List[int]:
     """
@@ -31,25 +34,165 @@ def parse_pages_arg(pages_arg: str, max_pages: int) -> List[int]:
                 raise ValueError(f"Invalid page number. Error: {e}")
     return sorted(result)
 
-def extract_page(doc: fitz.Document, pages: List[int], max_width: int = 1600, jpg_quality: int = 80):
+def count_selected_pages(pdf_path: str, pages_arg: str) -> int:
+    with fitz.open(pdf_path) as doc:
+        return len(parse_pages_arg(pages_arg, len(doc)))
+
+def page_features(p: fitz.Page) -> dict:
+    """
+    Measure what a page contains: characters in the text layer, vector
+    drawings, embedded images, and whether any pixel carries real colour.
+    """
+    text_chars = len("".join(p.get_text("text").split()))
+    drawings = len(p.get_cdrawings())
+    images = len(p.get_images(full=False))
+    # A small thumbnail is enough to tell colour from black/white/grey
+    thumb = p.get_pixmap(matrix=fitz.Matrix(64 / float(p.rect.width or 64), 64 / float(p.rect.width or 64)), alpha=False)
+    samples = thumb.samples
+    coloured = 0
+    for k in range(0, len(samples) - 2, 3):
+        r, g, b = samples[k], samples[k+1], samples[k+2]
+        if max(r, g, b) - min(r, g, b) > 24:
+            coloured += 1
+    pixels = max(1, thumb.width * thumb.height)
+    return {
+        "text_chars": text_chars,
+        "drawings": drawings,
+        "images": images,
+        "colored": coloured / pixels > COLOR_PIXEL_RATIO,
+    }
+
+def page_text_layer(p: fitz.Page) -> Tuple[str, bool]:
+    """
+    Turn the PDF text layer into light markup for the model: '#' marks lines set
+    larger than the body text, <b>/<i> mark bold and italic spans and <m> marks
+    spans set in math fonts. Also reports whether any math glyph was seen.
+    """
+    blocks = p.get_text("dict", flags=fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES, sort=True)["blocks"]
+    lines = [line for block in blocks for line in block.get("lines", [])]
+    sizes = Counter()
+    for line in lines:
+        for span in line["spans"]:
+            sizes[round(span["size"])] += len(span["text"].strip())
+    body_size = sizes.most_common(1)[0][0] if sizes else 0
+    has_math = False
     out = []
+    for line in lines:
+        parts = []
+        line_size = 0
+        for span in line["spans"]:
+            text = span["text"]
+            if not text.strip():
+                parts.append(text)
+                continue
+            line_size = max(line_size, span["size"])
+            if re.search(MATH_FONT_PATTERN, span["font"], re.I) or re.search(MATH_CHAR_PATTERN, text):
+                has_math = True
+                text = f"<m>{text}</m>"
+            elif span["flags"] & 16:
+                text = f"<b>{text}</b>"
+            elif span["flags"] & 2:
+                text = f"<i>{text}</i>"
+            parts.append(text)
+        text = "".join(parts).strip()
+        if not text:
+            continue
+        if body_size and line_size > body_size * 1.15:
+            text = "# " + text
+        out.append(text)
+    return "\n".join(out), has_math
+
+def choose_encoding(features: dict) -> dict:
+    if features["images"] or not features["text_chars"]:
+        profile = "scanned"
+    elif features["drawings"]:
+        profile = "figure"
+    elif features["text_chars"] < SPARSE_TEXT_CHARS:
+        profile = "sparse"
+    else:
+        profile = "text"
+    encoding = dict(ENCODING_PROFILES[profile], profile=profile)
+    if features["colored"]:
+        encoding["grayscale"] = False
+    return encoding
+def encode_page(p: fitz.Page, max_width: int, jpg_quality: int, grayscale: bool = False, fmt: str = "jpg") -> Tuple[str, bytes]:
+    rect = p.rect
+    scale = min(max_width / float(rect.width or max_width), 4.0)
+    mat = fitz.Matrix(scale, scale)
+    pix = p.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csGRAY if grayscale else fitz.csRGB)
+    data = pix.tobytes("jpg", jpg_quality=jpg_quality)
+    mime = "image/jpeg"
+    if fmt == "png":
+        # Line art often compresses better losslessly; keep whichever is smaller
+        png = pix.tobytes("png")
+        if len(png) < len(data):
+            data, mime = png, "image/png"
+    return mime, data
+
+def page_mode(features: dict, text: str, has_math: bool) -> str:
+    # Scans and text layers with unmapped glyphs need the image;
+    # born-digital pages with math or figures send both
+    if features["images"] or not features["text_chars"] or "\ufffd" in text:
+        return "image"
+    if has_math or features["drawings"]:
+        return "hybrid"
+    return "text"
+
+def iter_pages(doc: fitz.Document, pages: List[int], max_width: int = 1600, jpg_quality: int = 80, adaptive: bool = False, text_layer: bool = False, report: list = None, tracer: Tracer = NO_TRACE):
+    """
+    Lazily rasterize the selected pages, one (page number, page) at a time,
+    so callers only hold the pages they are currently working on. A page is
+    {"mode": "image"|"hybrid"|"text", "image": image part or None, "text": text layer or None}.
+    With adaptive=True the resolution, colour space and format are picked per page
+    from page_features; with text_layer=True born-digital pages carry their text
+    layer and a smaller image, or no image at all when they have no math or drawings.
+    One entry per page is appended to report if given, and the time spent
+    reading the text layer, rasterizing and base64-encoding goes to tracer.
+    """
     for i in pages:
         p = doc[i-1]
-        rect = p.rect
-        scale = min(max_width / float(rect.width or max_width), 4.0)
-        mat = fitz.Matrix(scale, scale)
-        pix = p.get_pixmap(matrix=mat, alpha=False)
-        jpg = pix.tobytes("jpg", jpg_quality=jpg_quality)
-        data_url = "data:image/jpeg;base64," + base64.b64encode(jpg).decode("ascii")
-        out.append((i, {"type": "image_url", "image_url": {"url": data_url}}))
-    return out
-
-def extract_pdf(doc: fitz.Document, pages: List[int], out_dir:str ):
+        features = page_features(p) if (adaptive or text_layer) else {}
+        mode, text = "image", None
+        if text_layer:
+            with tracer.span("text_layer", pages=[i]):
+                text, has_math = page_text_layer(p)
+            mode = page_mode(features, text, has_math)
+        if mode == "hybrid":
+            encoding = dict(ENCODING_PROFILES["hybrid"], profile="hybrid")
+            if features["colored"]:
+                encoding["grayscale"] = False
+        elif adaptive:
+            encoding = choose_encoding(features)
+        else:
+            encoding = {"profile": "fixed", "max_width": max_width, "jpg_quality": jpg_quality, "grayscale": False, "format": "jpg", "detail": "auto"}
+        img_part, data_len, mime = None, 0, None
+        if mode != "text":
+            with tracer.span("rasterize", pages=[i]) as span:
+                mime, data = encode_page(p, encoding["max_width"], encoding["jpg_quality"], encoding["grayscale"], encoding["format"])
+                span["image_bytes"] = len(data)
+            with tracer.span("base64", pages=[i]):
+                data_url = f"data:{mime};base64," + base64.b64encode(data).decode("ascii")
+            data_len = len(data)
+            image_url = {"url": data_url}
+            if encoding["detail"] != "auto":
+                image_url["detail"] = encoding["detail"]
+            img_part = {"type": "image_url", "image_url": image_url}
+        if report is not None:
+            report.append(dict(page=i, mode=mode, **encoding, **features, mime=mime, bytes=data_len,
+                               payload_bytes=(len(img_part["image_url"]["url"]) if img_part else 0) + len(text or "")))
+        yield (i, {"mode": mode, "image": img_part, "text": text if mode != "image" else None})
+
+def extract_page(doc: fitz.Document, pages: List[int], max_width: int = 1600, jpg_quality: int = 80):
+    return list(iter_pages(doc, pages, max_width=max_width, jpg_quality=jpg_quality))
+
+def extract_pdf(doc: fitz.Document, pages: List[int], out_dir:str, name:str = "extracted.pdf"):
     try:
         new_pdf = fitz.open()
         for page in pages:
-            new_pdf.insert_pdf(doc,from_page=page,to_page=page)
-        new_pdf.save(out_dir+"/extracted.pdf")
-        return out_dir+"/extracted.pdf"
+            # pages are 1-based, insert_pdf is 0-based
+            new_pdf.insert_pdf(doc,from_page=page-1,to_page=page-1)
+        new_pdf.save(out_dir+"/"+name)
+        new_pdf.close()
+        return out_dir+"/"+name
     except Exception as e:
         raise e
@@ -0,0 +1,99 @@
+import os,json,time,glob
+from typing import List, Optional
+from sanitization.sanitize_llm import bad_output_reason
+from constants.constants import PREVIEW_INTERVAL_SECONDS,STREAM_CHECK_CHARS
+
+def preview_dir(out_dir: str) -> str:
+    return os.path.join(out_dir, "previews")
+
+class PagePreview:
+    """
+    Streaming callback for one request (a page or a batch of pages). Writes
+    the partial LaTeX to previews/page_NNN.tex at most every
+    PREVIEW_INTERVAL_SECONDS and the timing stats to previews/page_NNN.json,
+    and tells the client to abandon output that bad_output_reason rejects.
+    Each delta is checked together with the last STREAM_CHECK_CHARS of the
+    output before it, so checking stays linear in the length of the output.
+    """
+    def __init__(self, out_dir: str, pnos: List[int]):
+        self.dir = preview_dir(out_dir)
+        os.makedirs(self.dir, exist_ok=True)
+        self.pnos = list(pnos)
+        self.name = f"page_{self.pnos[0]:03d}"
+        self.start = time.monotonic()
+        self.first_token = None
+        self.chunks = 0
+        self.parts = []
+        self.length = 0
+        self.tail = ""
+        self.last_write = 0.0
+        self.check = True
+        self.retried = None
+
+    def __call__(self, delta: str) -> Optional[str]:
+        now = time.monotonic()
+        if self.first_token is None:
+            self.first_token = now
+        self.chunks += 1
+        self.parts.append(delta)
+        window = self.tail + delta
+        start = self.length <= STREAM_CHECK_CHARS   # the window still holds all of the output
+        self.length += len(delta)
+        self.tail = window[-STREAM_CHECK_CHARS:]
+        if now - self.last_write >= PREVIEW_INTERVAL_SECONDS:
+            self.last_write = now
+            self._write("".join(self.parts), done=False)
+        return bad_output_reason(window, start) if self.check else None
+
+    def reset(self):
+        # The request is sent again: drop the text of the failed attempt
+        self.parts = []
+        self.length = 0
+        self.tail = ""
+        self.last_write = time.monotonic()
+        self._write("", done=False)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.start
+        generating = time.monotonic() - self.first_token if self.first_token else 0
+        return {
+            "pages": self.pnos,
+            "ttft": self.first_token - self.start if self.first_token else None,
+            "tokens": self.chunks,
+            "tokens_per_sec": self.chunks / generating if generating > 0 else None,
+            "seconds": elapsed,
+            "retried": self.retried,
+        }
+
+    def _write(self, content: str, done: bool):
+        tex_path = os.path.join(self.dir, self.name + ".tex")
+        if done:
+            if os.path.exists(tex_path):
+                os.remove(tex_path)
+        else:
+            with open(tex_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tex_path + ".tmp", tex_path)
+        with open(os.path.join(self.dir, self.name + ".json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(dict(self.stats(), done=done), f)
+        os.replace(os.path.join(self.dir, self.name + ".json.tmp"), os.path.join(self.dir, self.name + ".json"))
+
+    def finish(self):
+        self._write("", done=True)
+
+def read_previews(out_dir: str) -> List[dict]:
+    # Stats of every streamed request, with the partial LaTeX of those in flight
+    previews = []
+    for path in sorted(glob.glob(os.path.join(preview_dir(out_dir), "page_*.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                preview = json.load(f)
+        except (OSError, ValueError):
+            continue
+        tex_path = path[:-len(".json")] + ".tex"
+        preview["partial"] = None
+        if not preview["done"] and os.path.exists(tex_path):
+            with open(tex_path, "r", encoding="utf-8") as f:
+                preview["partial"] = f.read()
+        previews.append(preview)
+    return previews
@@ -0,0 +1,98 @@
+import os,json,time,threading
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Optional
+
+TRACE_FILE = "trace.json"
+CHROME_TRACE_FILE = "trace.chrome.json"
+
+class Tracer:
+    """
+    Collects timed spans of one run from any thread. A span may name the
+    pages it worked on (pages=[...]) and carry counters such as bytes or
+    tokens in its args; write() turns them into a per-stage and per-page
+    report plus a Chrome trace (chrome://tracing, Perfetto, speedscope).
+    With an event bus, finished spans and event() calls are also published
+    to it.
+    """
+    def __init__(self, enabled: bool = True, events = None):
+        self.enabled = enabled
+        self.events = events
+        self.origin = time.perf_counter()
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, pages=(), **args):
+        # The yielded dict is the span's args; counters known only at the end can be added to it
+        if not self.enabled:
+            yield args
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append({"name": name, "start": start - self.origin, "seconds": end - start,
+                                   "thread": threading.current_thread().name, "pages": list(pages), "args": args})
+            if self.events:
+                self.events.publish(name, seconds=end - start, pages=list(pages), **args)
+
+    def event(self, kind: str, **fields):
+        if self.events:
+            self.events.publish(kind, **fields)
+
+    def summary(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        stages = defaultdict(lambda: {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+        pages = defaultdict(lambda: defaultdict(float))
+        for s in spans:
+            stage = stages[s["name"]]
+            stage["count"] += 1
+            stage["seconds"] += s["seconds"]
+            stage["max_seconds"] = max(stage["max_seconds"], s["seconds"])
+            # Batched requests are shared evenly by their pages
+            for pno in s["pages"]:
+                share = 1.0 / len(s["pages"])
+                pages[pno][s["name"] + "_seconds"] += s["seconds"] * share
+                for key, value in s["args"].items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        pages[pno][key] += value * share
+        wall = max((s["start"] + s["seconds"] for s in spans), default=0.0)
+        return {
+            "started": self.started,
+            "wall_seconds": wall,
+            "stages": dict(sorted(stages.items(), key=lambda kv: -kv[1]["seconds"])),
+            "pages": {pno: dict(values) for pno, values in sorted(pages.items())},
+        }
+
+    def chrome_trace(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        threads = {name: tid for tid, name in enumerate(dict.fromkeys(s["thread"] for s in spans), 1)}
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}} for name, tid in threads.items()]
+        events += [{"name": s["name"], "cat": "pipeline", "ph": "X", "pid": 1, "tid": threads[s["thread"]],
+                    "ts": s["start"] * 1e6, "dur": s["seconds"] * 1e6, "args": dict(s["args"], pages=s["pages"])}
+                   for s in spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, out_dir: str):
+        if not self.enabled:
+            return
+        with open(os.path.join(out_dir, TRACE_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(os.path.join(out_dir, CHROME_TRACE_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+# Default for callers that do not profile
+NO_TRACE = Tracer(enabled=False)
+
+def read_trace(out_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(out_dir, TRACE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,65 @@
+import random
+import pymupdf as fitz
+from typing import List
+
+PAGE_KINDS = ("text", "math", "figure", "cjk", "scanned")
+
+WORDS = ("lemma theorem proof section value function matrix vector space bound "
+         "sequence limit series integral measure result method model data").split()
+CJK_TEXT = "本文研究偏微分方程的数值解法，并给出误差估计与收敛性分析。"
+# In the Symbol font these letters are set as Greek glyphs
+SYMBOL_TEXT = "a + b = g,  S f(x) d x  <  e"
+
+def paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def draw_text_page(page: fitz.Page, rng: random.Random, title: str):
+    page.insert_text((72, 80), title, fontsize=18, fontname="hebo")
+    page.insert_textbox(fitz.Rect(72, 100, 540, 740), "\n\n".join(paragraph(rng, 60) for _ in range(5)), fontsize=11)
+
+def draw_math_page(page: fitz.Page, rng: random.Random, title: str):
+    page.insert_text((72, 80), title, fontsize=18, fontname="hebo")
+    y = 110
+    for _ in range(6):
+        page.insert_textbox(fitz.Rect(72, y, 540, y + 70), paragraph(rng, 40), fontsize=11)
+        page.insert_text((150, y + 85), SYMBOL_TEXT, fontsize=13, fontname="symb")
+        y += 105
+
+def draw_figure_page(page: fitz.Page, rng: random.Random, title: str):
+    page.insert_text((72, 80), title, fontsize=18, fontname="hebo")
+    page.insert_textbox(fitz.Rect(72, 100, 540, 200), paragraph(rng, 50), fontsize=11)
+    page.draw_rect(fitz.Rect(100, 230, 500, 530), color=(0, 0, 0))
+    points = [fitz.Point(100 + 20 * i, 530 - rng.uniform(0, 280)) for i in range(21)]
+    page.draw_polyline(points, color=(0.8, 0.1, 0.1), width=1.5)
+    for _ in range(5):
+        page.draw_circle(fitz.Point(rng.uniform(130, 470), rng.uniform(260, 500)), 8, color=(0.1, 0.3, 0.8), fill=(0.1, 0.3, 0.8))
+    page.insert_text((220, 560), "Figure 1: synthetic plot", fontsize=10)
+
+def draw_cjk_page(page: fitz.Page, rng: random.Random, title: str):
+    page.insert_text((72, 80), title, fontsize=18, fontname="hebo")
+    page.insert_textbox(fitz.Rect(72, 100, 540, 740), (CJK_TEXT * 4 + "\n") * 8, fontsize=12, fontname="china-s")
+
+def draw_scanned_page(page: fitz.Page, rng: random.Random, title: str):
+    # A rendered text page pasted back as an image, without a text layer
+    scratch = fitz.open()
+    draw_text_page(scratch.new_page(), rng, title)
+    pix = scratch[0].get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+    page.insert_image(page.rect, stream=pix.tobytes("jpg", jpg_quality=70))
+    scratch.close()
+
+DRAW = {"text": draw_text_page, "math": draw_math_page, "figure": draw_figure_page,
+        "cjk": draw_cjk_page, "scanned": draw_scanned_page}
+
+def make_pdf(path: str, pages: int, kinds: List[str] = PAGE_KINDS, seed: int = 0) -> str:
+    """
+    Write a deterministic PDF of the given number of US-letter pages whose
+    content cycles through kinds (see PAGE_KINDS). Returns path.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(pages):
+        kind = kinds[i % len(kinds)]
+        DRAW[kind](doc.new_page(width=612, height=792), rng, f"{i + 1}. Synthetic {kind} page")
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return path
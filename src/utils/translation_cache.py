@@ -0,0 +1,94 @@
+import os,json,hashlib,threading
+from typing import List, Optional
+from constants.constants import CACHE_DIR,CACHE_MAX_BYTES
+
+def cache_key(model:str, system_msg:str, page:List[dict]) -> str:
+    """
+    Content address of a page request: the page parts (rendered JPEG data URL
+    and text), the full system prompt and the model name.
+    """
+    h = hashlib.sha256()
+    for part in (model, system_msg, json.dumps(page, sort_keys=True, ensure_ascii=False)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+class TranslationCache:
+    """
+    Persistent LaTeX cache, one file per key. The file mtime is used as the
+    last access time so eviction is least-recently-used across runs.
+    """
+    def __init__(self, cache_dir:str = CACHE_DIR, max_bytes:int = CACHE_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None  # total bytes on disk, scanned lazily
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".tex")
+
+    def get(self, key:str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                body = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return body
+
+    def put(self, key:str, body:str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(body)
+        size = os.path.getsize(tmp)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(s for _, s, _ in self._entries())
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+            os.replace(tmp, path)
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> List[tuple]:
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".tex"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        # Oldest access first until the cache fits under the cap again
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}